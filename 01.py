@@ -1,106 +1,263 @@
 import os
+import re
 import json
+import time
 import base64
+import contextvars
 import requests
 from typing import List, TypedDict, Literal
-from langchain_openai import ChatOpenAI
+from concurrent.futures import TimeoutError as FutureTimeout
 from langchain_core.messages import HumanMessage
 from langgraph.graph import StateGraph, END
-from playwright.sync_api import sync_playwright
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+from common.answer_cache import AnswerCache
+from common.browser_pool import BrowserPool
+from common.page_cache import PageCache, content_hash
+from common.fact_store import parse_facts, merge_facts, render_facts
+from common.search_client import SearxngClient
+from common.tracing import Tracer
+from common.llm_client import chat_model
 
 # --- 1. 設定區域 ---
-SEARXNG_URL = "https://puli-8080.huannago.com/search"
+# 端點與快取位置可用環境變數覆寫 (離線壓測時指向本機替身服務)
+SEARXNG_URL = os.environ.get("SEARXNG_URL", "https://puli-8080.huannago.com/search")
+EMBED_API_URL = os.environ.get("EMBED_API_URL", "https://ws-04.wade0426.me/embed")
+LLM_BASE_URL = os.environ.get("LLM_BASE_URL", "https://ws-02.wade0426.me/v1")
+CACHE_DIR = os.environ.get("CACHE_DIR", os.path.join(BASE_DIR, ".cache"))
+PAGE_CONCURRENCY = 4    # 同時分析的網頁數 (設為 1 即為逐一處理)
+PAGE_DEADLINE = 45      # 單一網頁 (導覽+截圖+VLM) 的最長等待秒數
+MIN_TEXT_CHARS = 400    # DOM 文字少於此長度視為圖片/腳本頁面，改用截圖 + VLM
+MAX_TEXT_CHARS = 6000   # 送給 LLM 的頁面文字上限
+KB_TOKEN_BUDGET = 2000  # planner / final_answer 收到的精煉資訊 token 上限
+NUM_KEYWORDS = 3        # 每輪產生的關鍵字變體數 (同時搜尋)
+MAX_RESULTS = 4         # 每輪合併去重後最多分析的網頁數
+
+# 節點 / LLM 耗時與 token 追蹤 (JSONL + 每次執行結束的摘要表)
+tracer = Tracer("day4", os.path.join(BASE_DIR, "out", "day4_trace.jsonl"))
 
-# 建議加上 max_retries 與 timeout 以應對之前遇到的 524 超時問題
-llm = ChatOpenAI(
-    base_url="https://ws-02.wade0426.me/v1",
-    api_key="your_api_key_here", 
-    model="google/gemma-3-27b-it",
+# 共用 LLM 用戶端：同端點共用 keep-alive 連線池與限流，429 時依 Retry-After 等待，避免批次跑出 502/524
+llm = chat_model(
+    LLM_BASE_URL,
+    "google/gemma-3-27b-it",
+    api_key="your_api_key_here",
     temperature=0,
+    timeout=120,
     max_retries=2,
-    timeout=120
+    stream_usage=True,
+    callbacks=[tracer.callback]
+)
+
+def get_embeddings(texts: List[str]):
+    payload = {"texts": texts, "normalize": True, "batch_size": 32}
+    try:
+        response = requests.post(EMBED_API_URL, json=payload, timeout=60)
+        response.raise_for_status()
+        return response.json()['embeddings']
+    except Exception as e:
+        print(f"❌ Embedding API 錯誤: {e}")
+        return []
+
+# 問題語意快取：相似問題直接沿用過往查證結果 (重啟後仍保留)
+os.makedirs(CACHE_DIR, exist_ok=True)
+answer_cache = AnswerCache(
+    os.path.join(CACHE_DIR, "answer_cache.sqlite"),
+    embed_fn=get_embeddings,
+    threshold=0.92,
+    ttl=24 * 3600,
+    max_entries=500
 )
 
 # --- 2. 狀態定義 ---
 class AgentState(TypedDict):
     question: str
-    keywords: str
+    keywords: List[str]
     knowledge_base: str
     cache_hit: bool
     final_answer: str
     count: int 
     feedback: str
+    decision: str       # Planner 判斷結果 (YES / NO)
+    page_tiers: List[str]
+    new_evidence: str   # 本輪 search_tool 新取得、尚未精煉的原始資料
+    facts: List[str]    # 已精煉並去重的事實清單
 
 # --- 3. 核心工具函數 ---
-def search_searxng(query: str, limit: int = 2):
-    params = {"q": query, "format": "json", "language": "zh-TW"}
-    try:
-        response = requests.get(SEARXNG_URL, params=params, timeout=10)
-        return [r for r in response.json().get('results', []) if 'url' in r][:limit]
-    except Exception as e:
-        print(f"❌ 搜尋出錯: {e}")
-        return []
+# 共用連線池與 TTL 結果快取的搜尋用戶端
+searxng = SearxngClient(SEARXNG_URL, ttl=3600, pool_size=NUM_KEYWORDS)
+
+def search_searxng(queries: List[str], limit: int = 2):
+    return searxng.search_many(queries, limit=limit, max_results=MAX_RESULTS)
+
+# 常駐瀏覽器池：PAGE_CONCURRENCY 條執行緒各只啟動一次 Chromium，page 重複使用
+browser_pool = BrowserPool(size=PAGE_CONCURRENCY, headless=True, max_uses=50)
+
+# 網頁分析快取：同一 URL 且截圖未變時不再送 VLM
+page_cache = PageCache(os.path.join(CACHE_DIR, "page_cache.sqlite"), max_bytes=50 * 1024 * 1024)
+
+# 擷取主要可讀文字：優先 article/main，並移除腳本、導覽列等雜訊
+EXTRACT_TEXT_JS = """
+() => {
+    const root = document.querySelector('article') || document.querySelector('main') || document.body;
+    if (!root) return {text: '', images: 0};
+    const clone = root.cloneNode(true);
+    clone.querySelectorAll('script, style, noscript, nav, header, footer, aside, form').forEach(e => e.remove());
+    return {text: clone.innerText || '', images: root.querySelectorAll('img, canvas, svg').length};
+}
+"""
 
-def vlm_analyze_page(url: str, question: str):
-    print(f"📸 [VLM] 啟動視覺閱讀: {url}")
+def read_page_text(page):
+    info = page.evaluate(EXTRACT_TEXT_JS)
+    text = "\n".join(line.strip() for line in info["text"].splitlines() if line.strip())
+    # 圖多字少的頁面 (圖表、資訊圖卡) 文字不足以代表內容
+    if len(text) < MIN_TEXT_CHARS or info["images"] > len(text) / 100:
+        return None
+    return text[:MAX_TEXT_CHARS]
+
+def vlm_analyze_page(page, url: str, question: str):
+    """分層閱讀網頁，回傳 (分析結果, 使用層級)。
+
+    層級：cache (分析快取命中) / text (DOM 文字) / vlm (截圖 + 多模態模型)
+    """
+    print(f"📸 [VLM] 啟動網頁閱讀: {url}")
     try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            page = browser.new_page(viewport={'width': 1280, 'height': 800})
-            page.goto(url, wait_until="domcontentloaded", timeout=15000)
-            page.wait_for_timeout(2000)
-            img_b64 = base64.b64encode(page.screenshot()).decode('utf-8')
-            browser.close()
-            
+        page.goto(url, wait_until="domcontentloaded", timeout=15000)
+        page.wait_for_timeout(2000)
+
+        text = read_page_text(page)
+        if text is not None:
+            tier, png = "text", None
+            page_hash = content_hash(text)
+        else:
+            tier, png = "vlm", page.screenshot()
+            page_hash = content_hash(png)
+
+        cached = page_cache.get_analysis(url, page_hash, question)
+        if cached is not None:
+            print(f"⚡ [VLM] 分析快取命中: {url}")
+            tracer.count("cache_hits")
+            return cached, "cache"
+
+        summary = page_cache.get_summary(url, page_hash)
+        if summary is None and tier == "text":
+            # 文字頁面直接以擷取的文字作為頁面摘要，不需多模態呼叫
+            summary = text
+            page_cache.put_summary(url, page_hash, summary)
+        elif summary is None:
+            # 先產生與問題無關的頁面摘要，供之後不同問題共用
+            img_b64 = base64.b64encode(png).decode('utf-8')
             msg = HumanMessage(content=[
-                {"type": "text", "text": f"分析此截圖內容並針對問題 '{question}' 提供關鍵資訊。"},
+                {"type": "text", "text": "請詳細整理此網頁截圖中的所有事實資訊 (人物、數字、日期、事件)，以條列式輸出。"},
                 {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img_b64}"}}
             ])
-            return llm.invoke([msg]).content
+            summary = llm.invoke([msg]).content
+            page_cache.put_summary(url, page_hash, summary)
+        else:
+            print(f"⚡ [VLM] 頁面摘要快取命中，跳過截圖分析: {url}")
+            tracer.count("cache_hits")
+
+        prompt = f"以下是網頁內容：\n{summary}\n\n請針對問題 '{question}' 提供關鍵資訊。"
+        analysis = llm.invoke(prompt).content
+        page_cache.put_analysis(url, page_hash, question, analysis)
+        return analysis, tier
     except Exception as e:
-        return f"網頁閱讀失敗: {e}"
+        return f"網頁閱讀失敗: {e}", "error"
 
 # --- 4. LangGraph 節點實作 ---
 
 def check_cache(state: AgentState):
     print("\n[Node] 1. 檢查快取...")
-    return {"cache_hit": False, "knowledge_base": "", "count": 0, "feedback": ""}
+    hit = answer_cache.lookup(state['question'])
+    if hit:
+        print(f"⚡ 快取命中 (相似度 {hit['score']:.3f}): {hit['question']}")
+        tracer.count("cache_hits")
+        return {"cache_hit": True, "knowledge_base": hit['knowledge_base'],
+                "final_answer": hit['answer'], "count": 0, "feedback": ""}
+    return {"cache_hit": False, "knowledge_base": "", "count": 0, "feedback": "",
+            "new_evidence": "", "facts": []}
 
 def query_gen(state: AgentState):
     new_count = state.get("count", 0) + 1
     fb = f"\n前次思考反饋：{state['feedback']}" if state['feedback'] else ""
     print(f"🔄 [Node] 2. 第 {new_count}/3 次搜尋 - 生成關鍵字...")
     
-    prompt = f"問題：'{state['question']}'{fb}\n請產出一個精準的搜尋關鍵字（僅輸出字串內容）。"
-    keyword = llm.invoke(prompt).content.strip().replace('"', '')
-    return {"keywords": keyword, "count": new_count}
+    prompt = (f"問題：'{state['question']}'{fb}\n"
+              f"請產出 {NUM_KEYWORDS} 個不同角度的精準搜尋關鍵字，每行一個（僅輸出關鍵字本身）。")
+    lines = llm.invoke(prompt).content.replace('"', '').splitlines()
+    # 去掉模型可能加上的項目符號或編號
+    keywords = [re.sub(r"^\s*(?:[-*•]|\d+[.)、])\s*", "", k).strip() for k in lines]
+    keywords = [k for k in keywords if k]
+    return {"keywords": keywords[:NUM_KEYWORDS] or [state['question']], "count": new_count}
+
+def analyze_results(results: list, question: str):
+    """並行分析所有搜尋結果，依來源順序回傳 (分析, 層級)；超過 PAGE_DEADLINE 的網頁以逾時訊息代替。"""
+    started = {}
+
+    def task(i, url):
+        started[i] = time.monotonic()
+        try:
+            with browser_pool.lease() as page:
+                analysis, tier = vlm_analyze_page(page, url, question)
+                if tier == "error":
+                    # 導覽失敗的 page 狀態不明，不放回池中
+                    browser_pool.discard()
+                return analysis, tier
+        except Exception as e:
+            # 瀏覽器啟動或開新 context 失敗只影響這個網頁
+            return f"網頁閱讀失敗: {e}", "error"
+
+    # 複製 context，讓 worker 執行緒中的 LLM 呼叫仍歸屬到目前的執行與節點
+    futures = [browser_pool.submit(contextvars.copy_context().run, task, i, r['url'])
+               for i, r in enumerate(results)]
+    analyses = []
+    for i, fut in enumerate(futures):
+        while True:
+            # 期限從該網頁實際開始處理時起算，排隊等待的時間不計入
+            t0 = started.get(i)
+            remaining = PAGE_DEADLINE - (time.monotonic() - t0) if t0 else PAGE_DEADLINE
+            try:
+                analyses.append(fut.result(timeout=max(remaining, 0.1)))
+                break
+            except FutureTimeout:
+                t0 = started.get(i)
+                if t0 and time.monotonic() - t0 >= PAGE_DEADLINE:
+                    print(f"⏱️ [VLM] 超過 {PAGE_DEADLINE} 秒，略過: {results[i]['url']}")
+                    analyses.append((f"網頁閱讀逾時 ({PAGE_DEADLINE} 秒)", "timeout"))
+                    break
+    return analyses
 
 def search_tool(state: AgentState):
-    print(f"🔍 [Node] 3. 執行檢索: {state['keywords']}")
+    print(f"🔍 [Node] 3. 執行檢索: {' | '.join(state['keywords'])}")
     results = search_searxng(state['keywords'])
     info = ""
-    for r in results:
-        analysis = vlm_analyze_page(r['url'], state['question'])
+    tiers = []
+    for r, (analysis, tier) in zip(results, analyze_results(results, state['question'])):
         info += f"\n[來源: {r['title']}]\n{analysis}\n"
-    return {"knowledge_base": state['knowledge_base'] + info}
+        tiers.append(tier)
+    print(f"📊 [網頁閱讀] 層級: {tiers} | 快取 {page_cache.stats} | 命中率 {page_cache.hit_rate():.0%}")
+    return {"new_evidence": info, "page_tiers": state.get('page_tiers', []) + tiers}
 
 # ⭐ 新增節點：資訊精煉 (Research Refiner)
 def research_refiner(state: AgentState):
     print("🧹 [Node] 4. 資訊精煉 - 過濾雜訊...")
-    if not state['knowledge_base']:
-        return {"knowledge_base": "尚未取得有效資訊"}
-    
-    prompt = f"""
-    你是一個資料處理專家。請根據問題整理目前的搜尋資訊。
+    facts = state.get('facts', [])
+    if state.get('new_evidence'):
+        # 只精煉本輪新增的資料，再與既有事實合併去重
+        prompt = f"""
+    你是一個資料處理專家。請根據問題整理新取得的搜尋資訊。
     問題：{state['question']}
     
     原始資料：
-    {state['knowledge_base']}
+    {state['new_evidence']}
     
-    請移除廣告、重複內容，將事實以條列式摘要整理。如果資訊衝突，請並列說明。
+    請移除廣告、重複內容，將事實以條列式摘要整理，一行一條。如果資訊衝突，請並列說明。
     """
-    refined_info = llm.invoke(prompt).content
-    return {"knowledge_base": refined_info}
+        new_facts = parse_facts(llm.invoke(prompt).content)
+        facts = merge_facts(facts, new_facts)
+        print(f"   新增 {len(facts) - len(state.get('facts', []))} 條事實 (累計 {len(facts)} 條)")
+    if not facts:
+        return {"knowledge_base": "尚未取得有效資訊", "new_evidence": "", "facts": facts}
+    return {"knowledge_base": render_facts(facts, KB_TOKEN_BUDGET), "new_evidence": "", "facts": facts}
 
 def planner(state: AgentState):
     print(f"🧠 [Node] 5. Planner 評估中...")
@@ -124,24 +281,30 @@ def planner(state: AgentState):
         decision = "NO"
         feedback = "無法解析思考內容"
 
-    # 將決策暫存在 final_answer 欄位供路徑判斷使用
-    return {"feedback": feedback, "final_answer": decision}
+    return {"feedback": feedback, "decision": decision}
 
 def final_answer(state: AgentState):
     print("📢 [Node] 6. 生成最終報告...")
+    if state.get("cache_hit"):
+        # 快取命中時直接沿用過往報告，不再呼叫 LLM
+        return {"final_answer": state['final_answer']}
     prompt = f"請根據以下查證事實，為使用者寫一份專業、客觀的報告：\n{state['knowledge_base']}\n問題：{state['question']}"
-    res = llm.invoke(prompt).content
+    # 逐 token 生成；外部可透過 app.stream(stream_mode="messages") 即時取得
+    res = "".join(chunk.content for chunk in llm.stream(prompt))
+    # 只快取 Planner 判定資訊充足的答案
+    if "YES" in state.get("decision", ""):
+        answer_cache.store(state['question'], res, state['knowledge_base'])
     return {"final_answer": res}
 
 # --- 5. 構建流程圖 ---
 workflow = StateGraph(AgentState)
 
-workflow.add_node("check_cache", check_cache)
-workflow.add_node("query_gen", query_gen)
-workflow.add_node("search_tool", search_tool)
-workflow.add_node("research_refiner", research_refiner) # <-- 加入新節點
-workflow.add_node("planner", planner)
-workflow.add_node("final_answer", final_answer)
+workflow.add_node("check_cache", tracer.wrap("check_cache", check_cache))
+workflow.add_node("query_gen", tracer.wrap("query_gen", query_gen))
+workflow.add_node("search_tool", tracer.wrap("search_tool", search_tool))
+workflow.add_node("research_refiner", tracer.wrap("research_refiner", research_refiner)) # <-- 加入新節點
+workflow.add_node("planner", tracer.wrap("planner", planner))
+workflow.add_node("final_answer", tracer.wrap("final_answer", final_answer))
 
 workflow.set_entry_point("check_cache")
 
@@ -158,7 +321,7 @@ workflow.add_edge("research_refiner", "planner")    # 精煉後才給 Planner 
 
 def route_logic(state: AgentState):
     # 如果 Planner 說夠了 (YES) 或者次數到了 (>=3) 就結案
-    if state.get("count", 0) >= 3 or "YES" in state.get("final_answer", ""):
+    if state.get("count", 0) >= 3 or "YES" in state.get("decision", ""):
         return "final_answer"
     return "query_gen"
 
@@ -179,14 +342,28 @@ print("="*55 + "\n")
 
 
 
+def stream_report(question: str):
+    """執行查證流程並逐段產出最終報告文字 (快取命中時一次產出完整報告)。"""
+    streamed = False
+    inputs = {"question": question, "knowledge_base": "", "cache_hit": False, "count": 0, "decision": ""}
+    with tracer.run(question):
+        for mode, chunk in app.stream(inputs, stream_mode=["updates", "messages"]):
+            if mode == "messages":
+                msg, meta = chunk
+                # 只轉送 final_answer 節點的 token，忽略其他節點的 LLM 輸出
+                if meta.get("langgraph_node") == "final_answer" and msg.content:
+                    streamed = True
+                    yield msg.content
+            elif "final_answer" in chunk and not streamed:
+                yield chunk["final_answer"]["final_answer"]
+
 if __name__ == "__main__":
     q = input("請輸入查證問題：")
-    # 開始串流執行
-    for output in app.stream({"question": q, "knowledge_base": "", "cache_hit": False, "count": 0}):
-        for node, data in output.items():
-            # 當運行到 final_answer 節點完成時，輸出結果
-            if node == "final_answer" and "final_answer" in data:
-                # 確保我們拿到的是最終報告字串，而非 Planner 的 YES/NO
-                if len(data["final_answer"]) > 5: 
-                    print("\n" + "✨"*10 + " 查證報告 " + "✨"*10)
-                    print(data["final_answer"])
\ No newline at end of file
+    # 開始串流執行，報告邊生成邊輸出
+    first = True
+    for token in stream_report(q):
+        if first:
+            print("\n" + "✨"*10 + " 查證報告 " + "✨"*10)
+            first = False
+        print(token, end="", flush=True)
+    print()
\ No newline at end of file
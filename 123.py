@@ -1,18 +1,29 @@
 import os
 import re
+import csv
+import json
+import time
+import asyncio
+import argparse
 from typing import Annotated, TypedDict, Literal
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
 from langgraph.graph import StateGraph, END, add_messages
+from common.tracing import Tracer
+from common.llm_client import chat_model
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# 節點 / LLM 耗時與 token 追蹤
+tracer = Tracer("123", os.path.join(BASE_DIR, "out", "123_trace.jsonl"))
 
 # --- 1. 初始化與防崩潰設定 ---
-llm = ChatOpenAI(
-    base_url="https://ws-02.wade0426.me/v1",
+llm = chat_model(
+    "https://ws-02.wade0426.me/v1",
+    "google/gemma-3-27b-it",
     api_key="", # 照教材留空
-    model="google/gemma-3-27b-it",
     temperature=0,
     timeout=20,       # 連線超過 20 秒自動斷開
-    max_retries=2     # 失敗自動重試
+    max_retries=2,    # 失敗自動重試
+    callbacks=[tracer.callback]
 )
 
 # --- 2. 狀態定義 ---
@@ -29,6 +40,7 @@ def check_cache_node(state: AgentState):
     query = state["messages"][-1].content.lower()
     # 只要包含 langchain 或 基礎概念 就直接出答案
     if "langchain" in query or "基礎" in query:
+        tracer.count("cache_hits")
         return {"is_hit": True, "knowledge_base": "快取資料：LangChain 是一個旨在簡化 LLM 應用開發的框架。", "loop_count": 0}
     return {"is_hit": False, "knowledge_base": "", "loop_count": 0}
 
@@ -75,11 +87,11 @@ def decision_router(state: AgentState):
     return "sufficient" if "YES" in last_msg else "insufficient"
 
 workflow = StateGraph(AgentState)
-workflow.add_node("check_cache", check_cache_node)
-workflow.add_node("planner", planner_node)
-workflow.add_node("query_gen", query_gen_node)
-workflow.add_node("search_tool", search_tool_node)
-workflow.add_node("final_answer", final_answer_node)
+workflow.add_node("check_cache", tracer.wrap("check_cache", check_cache_node))
+workflow.add_node("planner", tracer.wrap("planner", planner_node))
+workflow.add_node("query_gen", tracer.wrap("query_gen", query_gen_node))
+workflow.add_node("search_tool", tracer.wrap("search_tool", search_tool_node))
+workflow.add_node("final_answer", tracer.wrap("final_answer", final_answer_node))
 
 workflow.set_entry_point("check_cache")
 workflow.add_conditional_edges("check_cache", cache_router, {"hit": "final_answer", "miss": "planner"})
@@ -88,10 +100,96 @@ workflow.add_edge("query_gen", "search_tool")
 workflow.add_edge("search_tool", "planner")
 workflow.add_edge("final_answer", END)
 
+# 每個問題各自獨立，不跨輪保存歷史 (訊息只在單次執行內增長)
 app = workflow.compile()
 
-# --- 5. 互動式介面 ---
-if __name__ == "__main__":
+# --- 5. 批次模式 ---
+def load_questions(path: str):
+    """讀取題目檔：.csv (q_id / questions 欄位)、.jsonl ({"q_id", "question"}) 或一行一題的純文字"""
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, "r", encoding="utf-8-sig") as f:
+        if ext == ".csv":
+            rows = [{k.strip().lower(): v for k, v in row.items()} for row in csv.DictReader(f)]
+            q_col = next((c for c in ['questions', 'question'] if rows and c in rows[0]), None)
+            if not q_col:
+                raise KeyError(f"❌ CSV 欄位不符！需要 questions 欄位。目前: {list(rows[0]) if rows else []}")
+            return [(str(r.get('q_id') or r.get('id') or i), r[q_col]) for i, r in enumerate(rows, 1)]
+        if ext == ".jsonl":
+            items = [json.loads(line) for line in f if line.strip()]
+            return [(str(it.get('q_id', i)), it['question']) for i, it in enumerate(items, 1)]
+        return [(str(i), line.strip()) for i, line in enumerate(f, 1) if line.strip()]
+
+async def run_batch(input_path: str, output_path: str, concurrency: int, checkpoint_path: str = None):
+    questions = load_questions(input_path)
+    # 已成功寫入結果檔的題目直接略過 (中斷後重跑時不重做)；帶 error 的紀錄會重跑，
+    # 重跑結果附加在檔尾，同一 q_id 以最後一筆為準
+    done, failed = set(), set()
+    if os.path.exists(output_path):
+        with open(output_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    (failed if "error" in record else done).add(record["q_id"])
+    todo = [(q_id, q) for q_id, q in questions if q_id not in done]
+    retry = len(failed - done)
+    print(f"🚀 批次模式：共 {len(questions)} 題，已完成 {len(done)} 題，待處理 {len(todo)} 題"
+          f"{f' (含先前失敗 {retry} 題)' if retry else ''} (並行 {concurrency})")
+
+    saver_cm = None
+    if checkpoint_path:
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver  # pip install langgraph-checkpoint-sqlite
+        saver_cm = AsyncSqliteSaver.from_conn_string(checkpoint_path)
+        batch_app = workflow.compile(checkpointer=await saver_cm.__aenter__())
+    else:
+        batch_app = workflow.compile()
+
+    sem = asyncio.Semaphore(concurrency)
+    write_lock = asyncio.Lock()
+    finished = 0
+    t0 = time.perf_counter()
+
+    async def run_one(q_id: str, question: str):
+        nonlocal finished
+        config = {"configurable": {"thread_id": f"batch-{q_id}"}}
+        init_state = {"messages": [HumanMessage(content=question)], "knowledge_base": "", "is_hit": False, "loop_count": 0}
+        async with sem:
+            start = time.perf_counter()
+            record = {"q_id": q_id, "question": question}
+            try:
+                with tracer.run(question, summary=False):
+                    snapshot = await batch_app.aget_state(config) if checkpoint_path else None
+                    if snapshot and snapshot.next:
+                        # 上次中斷在圖的中途：從 checkpoint 接續執行
+                        final = await batch_app.ainvoke(None, config)
+                    elif snapshot and snapshot.values:
+                        # 已跑完但結果尚未寫入檔案
+                        final = snapshot.values
+                    else:
+                        final = await batch_app.ainvoke(init_state, config)
+                record.update(answer=final["messages"][-1].content, is_hit=final.get("is_hit", False),
+                              loop_count=final.get("loop_count", 0))
+            except Exception as e:
+                record["error"] = repr(e)
+            record["elapsed"] = round(time.perf_counter() - start, 3)
+
+        # 每題完成就立即寫入結果
+        async with write_lock:
+            with open(output_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            finished += 1
+            if finished % 10 == 0 or finished == len(todo):
+                rate = finished / (time.perf_counter() - t0)
+                print(f"   ✅ {finished}/{len(todo)} 題完成 ({rate:.2f} 題/秒)")
+
+    try:
+        await asyncio.gather(*(run_one(q_id, q) for q_id, q in todo))
+    finally:
+        if saver_cm is not None:
+            await saver_cm.__aexit__(None, None, None)
+    print(f"\n✅ 批次完成！結果已儲存至: {output_path}")
+
+# --- 6. 互動式介面 ---
+def interactive():
     print("\n--- 🤖 自動查證 AI 啟動 (輸入 q 結束) ---")
     while True:
         user_input = input("\n請輸入你的問題: ")
@@ -99,8 +197,22 @@ if __name__ == "__main__":
         
         init_state = {"messages": [HumanMessage(content=user_input)], "knowledge_base": "", "is_hit": False, "loop_count": 0}
         
-        for event in app.stream(init_state):
-            for node, data in event.items():
-                print(f"📍 節點: [{node}]")
-                if "messages" in data:
-                    print(f"   內容: {data['messages'][-1].content}")
\ No newline at end of file
+        with tracer.run(user_input):
+            for event in app.stream(init_state):
+                for node, data in event.items():
+                    print(f"📍 節點: [{node}]")
+                    if data and "messages" in data:
+                        print(f"   內容: {data['messages'][-1].content}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="自動查證 AI")
+    parser.add_argument("--batch", help="批次模式：題目檔 (.csv / .jsonl / 一行一題 .txt)")
+    parser.add_argument("--output", default="batch_results.jsonl", help="批次結果輸出 (JSONL，逐題寫入)")
+    parser.add_argument("--concurrency", type=int, default=8, help="同時處理的題數上限")
+    parser.add_argument("--checkpoint", help="SQLite checkpoint 檔，可在中斷後接續未完成的題目")
+    args = parser.parse_args()
+
+    if args.batch:
+        asyncio.run(run_batch(args.batch, args.output, args.concurrency, args.checkpoint))
+    else:
+        interactive()
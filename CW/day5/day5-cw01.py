@@ -1,7 +1,7 @@
 import os
+import sys
 import uuid
 import time
-import requests
 import pandas as pd
 from qdrant_client import QdrantClient
 from qdrant_client.models import (
@@ -10,13 +10,22 @@ from qdrant_client.models import (
 )
 from langchain_text_splitters import CharacterTextSplitter
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# 讓子資料夾腳本也能匯入根目錄的 common 共用模組
+sys.path.append(os.path.dirname(os.path.dirname(BASE_DIR)))
+from common.embed_client import EmbeddingClient
+from common.embed_cache import EmbeddingCache
+
 # === 全域配置 ===
 EMBED_URL = "https://ws-04.wade0426.me/embed"
 QDRANT_URL = "http://localhost:6333"
+UPSERT_BATCH = 256  # 每次寫入 Qdrant 的點數
 
 class VectorSearchLab:
     def __init__(self, url):
         self.client = QdrantClient(url=url)
+        # 相同文字的向量存在本地快取，重跑實驗不必再呼叫 API
+        self.embedder = EmbeddingClient(EMBED_URL, normalize=True, max_batch=32, cache=EmbeddingCache())
         # 定義實驗模式與對應的度量方式
         self.experiments = {
             "COSINE": {"collection": "lab_cosine", "metric": Distance.COSINE},
@@ -24,23 +33,11 @@ class VectorSearchLab:
             "EUCLID": {"collection": "lab_euclidean", "metric": Distance.EUCLID}
         }
 
-    def fetch_embeddings(self, texts):
-        """封裝 API 請求邏輯"""
-        try:
-            res = requests.post(EMBED_URL, json={"texts": texts, "normalize": True, "batch_size": 32})
-            res.raise_for_status()
-            return res.json().get('embeddings', [])
-        except Exception as e:
-            print(f"❌ API 連線失敗: {e}")
-            return []
-
     def prepare_collections(self):
         """自動偵測模型維度並初始化三種實驗庫"""
         print("🛠️ 正在初始化實驗環境...")
-        sample_vec = self.fetch_embeddings(["init"])
-        if not sample_vec: return
-        
-        dim = len(sample_vec[0])
+        # API 連不上時 EmbeddingError 直接拋出，不留下未建立的集合
+        dim = len(self.embedder.embed(["init"])[0])
         for mode, cfg in self.experiments.items():
             name = cfg["collection"]
             # 若已存在則刪除舊資料
@@ -63,24 +60,24 @@ class VectorSearchLab:
         chunks = splitter.split_text(raw_text)
         print(f"✂️ 文本切割為 {len(chunks)} 個片段")
 
-        vectors = self.fetch_embeddings(chunks)
-        if not vectors: return
+        vectors = self.embedder.embed(chunks)
 
-        # 同步推送到三個不同的資料庫
+        # 同步推送到三個不同的資料庫 (分批寫入)
         for mode, cfg in self.experiments.items():
-            points = [
-                PointStruct(
-                    id=str(uuid.uuid4()), # 使用 UUID 確保唯一性
-                    vector=vectors[i],
-                    payload={"text": chunks[i], "category": category}
-                ) for i in range(len(chunks))
-            ]
-            self.client.upsert(collection_name=cfg["collection"], points=points)
+            for start in range(0, len(chunks), UPSERT_BATCH):
+                points = [
+                    PointStruct(
+                        id=str(uuid.uuid4()), # 使用 UUID 確保唯一性
+                        vector=vectors[i],
+                        payload={"text": chunks[i], "category": category}
+                    ) for i in range(start, min(start + UPSERT_BATCH, len(chunks)))
+                ]
+                self.client.upsert(collection_name=cfg["collection"], points=points)
             print(f"📤 已將數據同步至 [{mode}]")
 
     def compare_retrieval(self, query_str, filter_cat=None):
         """執行跨庫對比檢索"""
-        query_vec = self.fetch_embeddings([query_str])[0]
+        query_vec = self.embedder.embed([query_str])[0]
         
         # 建立過濾器
         q_filter = None
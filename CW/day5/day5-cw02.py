@@ -1,19 +1,26 @@
 import os
 import io
+import sys
 import pandas as pd
-import requests
 import uuid
 from qdrant_client import QdrantClient
 from qdrant_client.models import Distance, VectorParams, PointStruct
 from langchain_text_splitters import RecursiveCharacterTextSplitter, CharacterTextSplitter
-from langchain_openai import ChatOpenAI
 
-# === 0. 初始化 LLM ===
-llm = ChatOpenAI(
-    base_url="https://ws-05.huannago.com/v1",
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# 讓子資料夾腳本也能匯入根目錄的 common 共用模組
+sys.path.append(os.path.dirname(os.path.dirname(BASE_DIR)))
+from common.llm_client import chat_model
+from common.embed_client import EmbeddingClient
+from common.embed_cache import EmbeddingCache
+
+# === 0. 初始化 LLM (共用連線池與限流) ===
+llm = chat_model(
+    "https://ws-05.huannago.com/v1",
+    "google/gemma-3-27b-it",
     api_key="YOUR_API_KEY", # ⚠️ 請在此填入您的 API Key
-    model="google/gemma-3-27b-it",
-    temperature=0.7
+    temperature=0.7,
+    timeout=600             # 沿用原本 openai SDK 預設的 600 秒
 )
 
 # === 1. 初始化與 VDB 設定 ===
@@ -26,16 +33,8 @@ MODES = {
 }
 
 EMBED_API_URL = "https://ws-04.wade0426.me/embed"
-
-def get_embeddings(texts):
-    payload = {"texts": texts, "normalize": True, "batch_size": 32}
-    try:
-        response = requests.post(EMBED_API_URL, json=payload)
-        response.raise_for_status()
-        return response.json()['embeddings']
-    except Exception as e:
-        print(f"❌ Embedding API 錯誤: {e}")
-        return []
+embedder = EmbeddingClient(EMBED_API_URL, normalize=True, max_batch=32, workers=4, cache=EmbeddingCache())
+UPSERT_BATCH = 256  # 每次寫入 Qdrant 的點數
 
 # === 2. 實作文字切塊對比印出 (text.txt) ===
 
@@ -140,21 +139,22 @@ def process_table_via_llm_and_chunk(folder_path):
 
 def upsert_to_vdb(chunks, category):
     if not chunks: return
-    vectors = get_embeddings(chunks)
-    if not vectors: return
-    
+    # 重試後仍取不到向量時直接拋出 EmbeddingError，不默默略過整個類別
+    vectors = embedder.embed(chunks)
+
     for mode, info in MODES.items():
         if not client.collection_exists(info["name"]):
             client.create_collection(
                 collection_name=info["name"],
                 vectors_config=VectorParams(size=len(vectors[0]), distance=info["dist"])
             )
-        # 使用 UUID
-        points = [
-            PointStruct(id=uuid.uuid4().hex, vector=vectors[i], payload={"text": chunks[i], "category": category}) 
-            for i in range(len(chunks))
-        ]
-        client.upsert(collection_name=info["name"], points=points)
+        # 使用 UUID，分批寫入
+        for start in range(0, len(chunks), UPSERT_BATCH):
+            points = [
+                PointStruct(id=uuid.uuid4().hex, vector=vectors[i], payload={"text": chunks[i], "category": category})
+                for i in range(start, min(start + UPSERT_BATCH, len(chunks)))
+            ]
+            client.upsert(collection_name=info["name"], points=points)
     print(f"\n✅ {category} 數據已成功存入 Qdrant。")
 
 # === 主程式 ===
@@ -2,16 +2,21 @@ import os
 import glob
 import pandas as pd
 import uuid
-import requests
 import sys
 import time
 from typing import List
 
 # LangChain 與模型相關組件
-from langchain_openai import ChatOpenAI
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from qdrant_client import QdrantClient, models
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# 讓子資料夾腳本也能匯入根目錄的 common 共用模組
+sys.path.append(os.path.dirname(os.path.dirname(BASE_DIR)))
+from common.llm_client import chat_model
+from common.embed_client import EmbeddingClient
+from common.embed_cache import EmbeddingCache
+
 # === 1. 配置與初始化 ===
 VLM_BASE_URL = "https://ws-02.wade0426.me/v1"
 VLM_MODEL = "google/gemma-3-27b-it"
@@ -19,41 +24,23 @@ EMBED_URL = "https://ws-04.wade0426.me/embed"
 COLLECTION_NAME = "gemma_multi_turn_rag"
 
 # 請確保 API Key 正確
-llm = ChatOpenAI(
-    base_url=VLM_BASE_URL,
-    api_key="", 
-    model=VLM_MODEL,
-    temperature=0,
-    timeout=60 
-)
+llm = chat_model(VLM_BASE_URL, VLM_MODEL, api_key="", temperature=0, timeout=60)
 
 client = QdrantClient(url="http://localhost:6333")
 
 # === 2. 高速向量化工具函數 (支援批次處理與重試) ===
-def get_embeddings_batch(texts: List[str]) -> List[List[float]]:
-    if not texts: return []
-    payload = {"texts": texts, "normalize": True, "task_description": "檢索技術與生活文件"}
-    for attempt in range(3):
-        try:
-            response = requests.post(EMBED_URL, json=payload, timeout=60)
-            response.raise_for_status()
-            return response.json().get("embeddings", [])
-        except Exception as e:
-            print(f"  ⚠️ Embedding 嘗試 {attempt+1} 失敗: {e}")
-            time.sleep(2)
-    return []
+# 先查本地 embedding 快取，未命中的才分批送出；失敗批次切半重試
+embedder = EmbeddingClient(EMBED_URL, normalize=True, task_description="檢索技術與生活文件",
+                           timeout=60, cache=EmbeddingCache())
+UPSERT_BATCH = 256  # 每次寫入 Qdrant 的點數
 
 # === 3. 初始化知識庫 (高速版) ===
 def initialize_db():
     print("\n" + "="*50)
     print("📡 [步驟 1/2] 正在高速初始化知識庫...")
     
-    sample = get_embeddings_batch(["check"])
-    if not sample:
-        print("🛑 向量伺服器連線失敗，程式停止。")
-        sys.exit(1)
-        
-    dim = len(sample[0])
+    # 向量伺服器連不上時 EmbeddingError 直接拋出，程式停止
+    dim = len(embedder.embed(["check"])[0])
     # 快速重置 Collection
     client.recreate_collection(
         collection_name=COLLECTION_NAME,
@@ -69,17 +56,16 @@ def initialize_db():
         with open(path, 'r', encoding='utf-8-sig', errors='replace') as f:
             content = f.read().replace('\ufffd', '')
             chunks = splitter.split_text(content)
-            vectors = get_embeddings_batch(chunks)
-            if vectors:
+            # 重試後仍失敗就拋出 EmbeddingError，不默默少掉整個檔案
+            vectors = embedder.embed(chunks)
+            for start in range(0, len(chunks), UPSERT_BATCH):
                 points = [models.PointStruct(
-                    id=str(uuid.uuid4()), 
-                    vector=v, 
+                    id=str(uuid.uuid4()),
+                    vector=v,
                     payload={"text": c, "source": file_name}
-                ) for c, v in zip(chunks, vectors)]
+                ) for c, v in zip(chunks[start:start + UPSERT_BATCH], vectors[start:start + UPSERT_BATCH])]
                 client.upsert(collection_name=COLLECTION_NAME, points=points)
-                print(f" ✅ ({len(chunks)} 區塊)")
-            else:
-                print(" ❌ 向量化失敗")
+            print(f" ✅ ({len(chunks)} 區塊)")
 
 # === 4. 執行 RAG 任務 (修正型別衝突與 502 錯誤) ===
 def run_rag_task():
@@ -127,15 +113,12 @@ def run_rag_task():
             except: time.sleep(2)
 
         # B. 檢索
-        q_vec_list = get_embeddings_batch([rewritten_q])
-        context, top_source = "", "未知"
-        if q_vec_list:
-            q_vec = q_vec_list[0]
-            hits = client.query_points(collection_name=COLLECTION_NAME, query=q_vec, limit=3).points
-            context = "\n".join([h.payload['text'] for h in hits])
-            top_source = hits[0].payload['source'] if hits else "未知來源"
-            for i, hit in enumerate(hits):
-                print(f"  📍 匹配項 {i+1}: {hit.payload['text'][:30]}...")
+        q_vec = embedder.embed([rewritten_q])[0]
+        hits = client.query_points(collection_name=COLLECTION_NAME, query=q_vec, limit=3).points
+        context = "\n".join([h.payload['text'] for h in hits])
+        top_source = hits[0].payload['source'] if hits else "未知來源"
+        for i, hit in enumerate(hits):
+            print(f"  📍 匹配項 {i+1}: {hit.payload['text'][:30]}...")
 
         # C. 回答生成 (處理 502 Bad Gateway)
         final_prompt = (
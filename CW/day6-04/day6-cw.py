@@ -1,20 +1,27 @@
 import os
+import sys
 import glob
 import pandas as pd
 import uuid
-import requests
 import torch
 import torch.nn.functional as F
 from typing import List
 
-# LangChain / OpenAI
-from langchain_openai import ChatOpenAI
+# LangChain
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 # Qdrant & Transformers
 from qdrant_client import QdrantClient, models
 from transformers import AutoTokenizer, AutoModelForCausalLM
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# 讓子資料夾腳本也能匯入根目錄的 common 共用模組
+sys.path.append(os.path.dirname(os.path.dirname(BASE_DIR)))
+from common.llm_client import chat_model
+from common.embed_client import EmbeddingClient
+from common.embed_cache import EmbeddingCache
+from common.pipeline import Pipeline
+
 # === 1. 配置與初始化 ===
 VLM_BASE_URL = "https://ws-02.wade0426.me/v1"
 VLM_MODEL = "google/gemma-3-27b-it"
@@ -22,11 +29,12 @@ EMBED_URL = "https://ws-04.wade0426.me/embed"
 COLLECTION_NAME = "gemma_hybrid_qwen3_rerank"
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 
-llm = ChatOpenAI(
-    base_url=VLM_BASE_URL,
+llm = chat_model(
+    VLM_BASE_URL,
+    VLM_MODEL,
     api_key="YOUR_API_KEY", # ⚠️ 請填入您的 API Key
-    model=VLM_MODEL,
-    temperature=0
+    temperature=0,
+    timeout=600             # 沿用原本 openai SDK 預設的 600 秒
 )
 
 # === 2. 載入本地 Qwen3 Reranker (修正 Linux 路徑) ===
@@ -55,14 +63,8 @@ client = QdrantClient(url="http://localhost:6333")
 
 # === 3. 工具函數 ===
 
-def get_embeddings(texts: List[str]) -> List[List[float]]:
-    payload = {"texts": texts, "normalize": True, "task_description": "檢索技術與生活文件"}
-    try:
-        response = requests.post(EMBED_URL, json=payload, timeout=60)
-        return response.json()["embeddings"]
-    except Exception as e:
-        print(f"❌ Embedding 失敗: {e}")
-        return []
+embedder = EmbeddingClient(EMBED_URL, normalize=True, task_description="檢索技術與生活文件", workers=4, timeout=60,
+                           cache=EmbeddingCache())
 
 def qwen3_rerank_score(query: str, doc: str) -> float:
     instruction = "根據查詢檢索相關文件"
@@ -81,7 +83,7 @@ def qwen3_rerank_score(query: str, doc: str) -> float:
 # === 4. 初始化知識庫 ===
 def initialize_db():
     print("📡 [步驟 1/2] 初始化 Qdrant 集合...")
-    sample_vec = get_embeddings(["check"])[0]
+    sample_vec = embedder.embed(["check"])[0]
     
     if client.collection_exists(COLLECTION_NAME):
         client.delete_collection(COLLECTION_NAME)
@@ -101,26 +103,33 @@ def initialize_db():
         )
     )
     
-    file_paths = glob.glob("data_0*.txt")
     splitter = RecursiveCharacterTextSplitter(chunk_size=400, chunk_overlap=50)
-    all_points = []
-    
-    for path in file_paths:
+
+    # 讀檔 → 切塊 → embedding → 分批上傳 串流進行，不再把所有片段堆成一個 all_points
+    def chunk_file(path):
         file_name = os.path.basename(path)
         with open(path, 'r', encoding='utf-8') as f:
-            chunks = splitter.split_text(f.read())
-            if not chunks: continue
-            vectors = get_embeddings(chunks)
-            for chunk, vec in zip(chunks, vectors):
-                all_points.append(models.PointStruct(
-                    id=str(uuid.uuid4()), 
-                    vector=vec, 
-                    payload={"text": chunk, "source": file_name}
-                ))
-    
-    if all_points:
-        client.upsert(collection_name=COLLECTION_NAME, points=all_points)
-    print(f"✅ 匯入完成，共 {len(all_points)} 個片段。")
+            for chunk in splitter.split_text(f.read()):
+                yield {"text": chunk, "source": file_name}
+
+    def embed_batch(items):
+        # 重試後仍失敗就拋出 EmbeddingError 中止匯入，不默默少掉整批片段
+        vectors = embedder.embed([item["text"] for item in items])
+        return [models.PointStruct(id=str(uuid.uuid4()), vector=vec, payload=item)
+                for item, vec in zip(items, vectors)]
+
+    def upsert_batch(points):
+        client.upsert(collection_name=COLLECTION_NAME, points=points)
+        return ()
+
+    stats = (
+        Pipeline("day6 匯入", queue_size=16)
+        .stage("chunk", chunk_file)
+        .stage("embed", embed_batch, workers=2, batch_size=64)
+        .stage("upsert", upsert_batch, batch_size=256)
+        .run(sorted(glob.glob("data_0*.txt")))
+    )
+    print(f"✅ 匯入完成，共 {stats['upsert']['in']} 個片段。")
 
 # === 5. 執行 RAG 任務 ===
 def run_rag_task():
@@ -145,7 +154,7 @@ def run_rag_task():
         rewritten_q = llm.invoke(f"改寫為搜尋句：{original_q}\n歷史：{history_str}").content.strip()
 
         # 2. Hybrid Search (RRF 融合向量與全文檢索)
-        q_vec = get_embeddings([rewritten_q])[0]
+        q_vec = embedder.embed([rewritten_q])[0]
         
         search_results = client.query_points(
             collection_name=COLLECTION_NAME,
@@ -0,0 +1,224 @@
+import os
+import random
+import re
+import tempfile
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+# 轉錄尚未完成時伺服器可能回傳的狀態碼
+NOT_READY = {202, 404, 409, 425, 429, 500, 502, 503, 504, 524}
+
+
+class AsrTimeout(Exception):
+    pass
+
+
+def srt_to_txt(srt: str) -> str:
+    """從 SRT 取出純文字 (去掉序號與時間軸)，不必再下載 TXT。"""
+    lines = []
+    for block in re.split(r"\r?\n\s*\r?\n", srt.strip()):
+        block_lines = [line.strip() for line in block.splitlines()]
+        # 只有區塊第一行 (緊接時間軸) 才是序號；內文中全是數字的行 (如 "2025") 要保留
+        if len(block_lines) > 1 and block_lines[0].isdigit() and "-->" in block_lines[1]:
+            block_lines = block_lines[1:]
+        if block_lines and "-->" in block_lines[0]:
+            block_lines = block_lines[1:]
+        lines.extend(line for line in block_lines if line)
+    return "\n".join(lines)
+
+
+SRT_TIME = re.compile(r"(\d{2}):(\d{2}):(\d{2})[,.](\d{3})")
+
+
+def _to_seconds(m) -> float:
+    return int(m[1]) * 3600 + int(m[2]) * 60 + int(m[3]) + int(m[4]) / 1000
+
+
+def _fmt_time(seconds: float) -> str:
+    ms = int(round(seconds * 1000))
+    h, ms = divmod(ms, 3600_000)
+    m, ms = divmod(ms, 60_000)
+    s, ms = divmod(ms, 1000)
+    return f"{h:02d}:{m:02d}:{s:02d},{ms:03d}"
+
+
+def merge_srts(parts: List[Tuple[str, float]]) -> str:
+    """依序合併多段 SRT：時間軸加上各段在原音檔中的起始秒數，並重新編號。"""
+    blocks = []
+    for srt, offset in parts:
+        for block in re.split(r"\r?\n\s*\r?\n", srt.strip()):
+            lines = block.strip().splitlines()
+            idx = next((i for i, line in enumerate(lines) if "-->" in line), None)
+            if idx is None:
+                continue
+            timing = SRT_TIME.sub(
+                lambda m: _fmt_time(_to_seconds(m) + offset),
+                lines[idx])
+            blocks.append([timing] + lines[idx + 1:])
+    return "\n\n".join(f"{i}\n" + "\n".join(b) for i, b in enumerate(blocks, 1)) + "\n"
+
+
+def split_srt_windows(srt: str, window_sec: float = 600) -> List[dict]:
+    """把 SRT 依開始時間切成固定長度的時間窗，每窗附上該段的 SRT 與純文字。"""
+    windows = {}
+    for block in re.split(r"\r?\n\s*\r?\n", srt.strip()):
+        lines = block.strip().splitlines()
+        idx = next((i for i, line in enumerate(lines) if "-->" in line), None)
+        m = SRT_TIME.search(lines[idx]) if idx is not None else None
+        if m is None:
+            continue
+        w = windows.setdefault(int(_to_seconds(m) // window_sec), [])
+        w.append((lines[idx], lines[idx + 1:]))
+    result = []
+    for i, key in enumerate(sorted(windows)):
+        cues = windows[key]
+        result.append({
+            "index": i,
+            "start": key * window_sec,
+            "end": (key + 1) * window_sec,
+            "srt": "\n\n".join(f"{n}\n{timing}\n" + "\n".join(text) for n, (timing, text) in enumerate(cues, 1)),
+            "txt": "\n".join(line.strip() for _, text in cues for line in text if line.strip()),
+        })
+    return result
+
+
+def split_on_silence(wav_path: str, out_dir: str, target_sec: float = 120, max_sec: float = 180,
+                     window_ms: int = 50, min_silence_ms: int = 400, silence_ratio: float = 0.1) -> List[Tuple[str, float]]:
+    """在靜音處把長音檔切成約 target_sec 的片段，回傳 [(片段路徑, 起始秒數)]。
+
+    靜音以視窗 RMS 低於整體中位數 * silence_ratio 判定；target_sec 之後、max_sec
+    之前找不到靜音時，直接在 max_sec 處切開。
+    """
+    with wave.open(wav_path, "rb") as w:
+        params = w.getparams()
+        raw = w.readframes(params.nframes)
+    dtype = {1: np.uint8, 2: np.int16, 4: np.int32}[params.sampwidth]
+    samples = np.frombuffer(raw, dtype=dtype).astype(np.float32)
+    if params.sampwidth == 1:
+        samples -= 128
+    samples = samples.reshape(-1, params.nchannels).mean(axis=1)
+
+    rate = params.framerate
+    win = max(1, rate * window_ms // 1000)
+    n_win = len(samples) // win
+    rms = np.sqrt(np.mean(samples[:n_win * win].reshape(n_win, win) ** 2, axis=1))
+    silent = rms < max(np.median(rms) * silence_ratio, 1e-6)
+
+    # 找出夠長的靜音區段，以其中點作為候選切點 (單位：視窗)
+    candidates = []
+    run_start = None
+    min_run = max(1, min_silence_ms // window_ms)
+    for i, s in enumerate(np.append(silent, False)):
+        if s and run_start is None:
+            run_start = i
+        elif not s and run_start is not None:
+            if i - run_start >= min_run:
+                candidates.append((run_start + i) // 2)
+            run_start = None
+
+    cuts = [0]
+    target_w, max_w = int(target_sec * 1000 / window_ms), int(max_sec * 1000 / window_ms)
+    while n_win - cuts[-1] > max_w:
+        start = cuts[-1]
+        options = [c for c in candidates if start + target_w <= c <= start + max_w]
+        cuts.append(options[0] if options else start + max_w)
+    cuts.append(n_win)
+
+    segments = []
+    frame_bytes = params.sampwidth * params.nchannels
+    for i, (a, b) in enumerate(zip(cuts, cuts[1:])):
+        if i == len(cuts) - 2:
+            b_frame = params.nframes  # 最後一段包含尾端不足一個視窗的樣本
+        else:
+            b_frame = b * win
+        path = os.path.join(out_dir, f"segment_{i:04d}.wav")
+        with wave.open(path, "wb") as out:
+            out.setparams(params)
+            out.writeframes(raw[a * win * frame_bytes:b_frame * frame_bytes])
+        segments.append((path, a * win / rate))
+    return segments
+
+
+class AsrClient:
+    """字幕 ASR 服務用戶端：共用連線池、指數退避輪詢與整體期限。"""
+
+    def __init__(self, base: str, auth: tuple, pool_size: int = 4,
+                 backoff_base: float = 1.0, backoff_cap: float = 15.0, deadline: float = 1200):
+        self.base = base
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.deadline = deadline
+        self.session = requests.Session()
+        self.session.auth = auth
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def create_task(self, wav_path: str) -> str:
+        with open(wav_path, "rb") as f:
+            r = self.session.post(f"{self.base}/api/v1/subtitle/tasks", files={"audio": f}, timeout=60)
+        r.raise_for_status()
+        return r.json()["id"]
+
+    def subtitle_url(self, task_id: str, fmt: str) -> str:
+        return f"{self.base}/api/v1/subtitle/tasks/{task_id}/subtitle?type={fmt}"
+
+    def download(self, task_id: str, fmt: str, deadline_at: float) -> str:
+        """輪詢下載字幕直到完成；間隔以指數退避 (含 jitter) 增加，超過期限則拋出 AsrTimeout。"""
+        url = self.subtitle_url(task_id, fmt)
+        attempt = 0
+        while True:
+            try:
+                resp = self.session.get(url, timeout=(5, 60))
+                if resp.status_code == 200:
+                    return resp.text
+                if resp.status_code not in NOT_READY:
+                    resp.raise_for_status()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                print(f"  ⚠️ [{fmt}] 連線問題，稍後重試: {e}")
+            delay = random.uniform(0.5, 1.0) * min(self.backoff_cap, self.backoff_base * 2 ** attempt)
+            if time.monotonic() + delay > deadline_at:
+                raise AsrTimeout(f"{fmt} 字幕在期限內未完成 (task {task_id})")
+            time.sleep(delay)
+            attempt += 1
+
+    def wait_results(self, task_id: str, derive_txt: bool = True) -> Tuple[str, str]:
+        deadline_at = time.monotonic() + self.deadline
+        if derive_txt:
+            srt = self.download(task_id, "SRT", deadline_at)
+            return srt, srt_to_txt(srt)
+        # 兩種格式同時下載，共用同一個期限
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            srt_f = pool.submit(self.download, task_id, "SRT", deadline_at)
+            txt_f = pool.submit(self.download, task_id, "TXT", deadline_at)
+            return srt_f.result(), txt_f.result()
+
+    def transcribe(self, wav_path: str, derive_txt: bool = True) -> Tuple[str, str]:
+        task_id = self.create_task(wav_path)
+        print(f"等待轉錄完成 (Task ID: {task_id})...")
+        return self.wait_results(task_id, derive_txt)
+
+    def transcribe_long(self, wav_path: str, workers: int = 4, target_sec: float = 120,
+                        max_sec: float = 180) -> Tuple[str, str]:
+        """長音檔模式：在靜音處切段、平行上傳轉錄，再把 SRT 依時間偏移接回。
+
+        音檔不超過 max_sec 時直接走單檔轉錄。
+        """
+        with wave.open(wav_path, "rb") as w:
+            duration = w.getnframes() / w.getframerate()
+        if duration <= max_sec:
+            return self.transcribe(wav_path)
+
+        with tempfile.TemporaryDirectory(prefix="asr_segments_") as tmp:
+            segments = split_on_silence(wav_path, tmp, target_sec, max_sec)
+            print(f"🔪 音檔長 {duration:.0f} 秒，切成 {len(segments)} 段，以 {workers} 個 worker 平行轉錄")
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                srts = list(pool.map(lambda seg: self.transcribe(seg[0])[0], segments))
+        srt = merge_srts([(s, offset) for s, (_, offset) in zip(srts, segments)])
+        return srt, srt_to_txt(srt)
@@ -1,51 +1,92 @@
-import time
+import os
+import sys
 import requests
 import operator
 from pathlib import Path
 from typing import Annotated, TypedDict
 from langgraph.graph import StateGraph, END
-from langchain_openai import ChatOpenAI
+from langgraph.types import Send
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# 讓子資料夾腳本也能匯入根目錄的 common 共用模組
+sys.path.append(os.path.dirname(os.path.dirname(BASE_DIR)))
+from common.tracing import Tracer
+from common.llm_client import chat_model
+from common.tokens import estimate_tokens
+from asr_client import AsrClient, AsrTimeout, split_srt_windows
+from result_cache import MeetingCache, file_hash, text_hash
+
+# 節點 / LLM 耗時與 token 追蹤
+tracer = Tracer("day3", os.path.join(BASE_DIR, "out", "day3_trace.jsonl"))
 
 # ==========================================
 # 1. ASR 語音辨識部分 (取得 20 秒音檔的完整內容)
 # ==========================================
 BASE = "https://3090api.huannago.com"
-CREATE_URL = f"{BASE}/api/v1/subtitle/tasks"
 WAV_PATH = "/home/pc-49/Downloads/Podcast_EP14_30s.wav" 
 auth = ("nutc2504", "nutc2504")
 
-def get_asr_results():
-    print("正在上傳音檔進行辨識...")
-    with open(WAV_PATH, "rb") as f:
-        r = requests.post(CREATE_URL, files={"audio": f}, timeout=60, auth=auth)
-    r.raise_for_status()
-    task_id = r.json()["id"]
-    
-    txt_url = f"{BASE}/api/v1/subtitle/tasks/{task_id}/subtitle?type=TXT"
-    srt_url = f"{BASE}/api/v1/subtitle/tasks/{task_id}/subtitle?type=SRT"
+ASR_WORKERS = 4          # 長音檔分段後同時轉錄的段數上限
+SEGMENT_SEC = 120        # 長音檔每段的目標長度 (秒)，會對齊到附近的靜音處
+
+# 共用連線池的 ASR 用戶端：指數退避輪詢 + 整體期限，TXT 直接由 SRT 轉出
+asr = AsrClient(BASE, auth, pool_size=ASR_WORKERS, deadline=1200)
 
-    def wait_download(url: str):
-        for _ in range(600):
-            try:
-                resp = requests.get(url, timeout=(5, 60), auth=auth)
-                if resp.status_code == 200: return resp.text
-            except: pass
-            time.sleep(2)
-        return None
+# 逐字稿與各節點 LLM 輸出的快取：同一音檔重跑時跳過 ASR 與未變動的節點
+CACHE_DIR = os.environ.get("CACHE_DIR", os.path.join(BASE_DIR, ".cache"))
+os.makedirs(CACHE_DIR, exist_ok=True)
+result_cache = MeetingCache(os.path.join(CACHE_DIR, "meeting_cache.sqlite"))
 
-    print(f"等待轉錄完成 (Task ID: {task_id})...")
-    return wait_download(srt_url), wait_download(txt_url)
+def get_asr_results():
+    audio_hash = file_hash(WAV_PATH)
+    cached = result_cache.get_transcript(audio_hash)
+    if cached:
+        print(f"⚡ 音檔內容未變 ({audio_hash[:12]})，沿用快取的逐字稿")
+        return cached
+    print("正在上傳音檔進行辨識...")
+    try:
+        # 短音檔直接整檔轉錄；長音檔自動切段平行處理
+        srt, txt = asr.transcribe_long(WAV_PATH, workers=ASR_WORKERS, target_sec=SEGMENT_SEC, max_sec=SEGMENT_SEC * 1.5)
+    except (AsrTimeout, requests.RequestException) as e:
+        print(f"❌ ASR 失敗: {e}")
+        return None, None
+    if srt and txt:
+        result_cache.put_transcript(audio_hash, srt, txt)
+    return srt, txt
 
 # ==========================================
 # 2. LangGraph 設定與定義
 # ==========================================
-llm = ChatOpenAI(
-    base_url="https://ws-02.wade0426.me/v1",
+SINGLE_SHOT_TOKENS = 6000   # 逐字稿低於此 token 數時整份一次送出，否則走 map-reduce
+WINDOW_SEC = 600            # map-reduce 時每個時間窗的長度 (秒)
+
+llm = chat_model(
+    "https://ws-02.wade0426.me/v1",
+    "google/gemma-3-27b-it",
     api_key="", 
-    model="google/gemma-3-27b-it",
-    temperature=0
+    temperature=0,
+    timeout=600,      # 沿用原本 openai SDK 預設的 600 秒；單次整理長逐字稿可能超過 2 分鐘
+    callbacks=[tracer.callback]
 )
 
+# 各節點的 prompt 模板；prompt 版本取模板內容的雜湊，改了模板就只有該節點重算
+MINUTES_PROMPT = "請將以下 SRT 內容轉為 Markdown 表格 (時間|發言內容):\n\n{text}"
+SUMMARY_PROMPT = "請摘要以下內容 (包含決策與待辦事項):\n\n{text}"
+WINDOW_SUMMARY_PROMPT = "請摘要以下會議片段 ({start} 起)，包含決策與待辦事項:\n\n{text}"
+REDUCE_PROMPT = "以下是同一場會議依時間順序的分段摘要，請整合成一份完整摘要 (包含決策與待辦事項)，去除重複內容:\n\n{text}"
+
+def cached_llm(node: str, template: str, text: str, **fields) -> str:
+    """以 (節點, 輸入雜湊, prompt 版本, 模型) 查快取，未命中才呼叫 LLM"""
+    input_hash = text_hash("\x00".join([text, *(f"{k}={v}" for k, v in sorted(fields.items()))]))
+    prompt_version = text_hash(template)[:12]
+    cached = result_cache.get_output(node, input_hash, prompt_version, llm.model_name)
+    if cached is not None:
+        tracer.count("cache_hits")
+        return cached
+    content = llm.invoke(template.format(text=text, **fields)).content
+    result_cache.put_output(node, input_hash, prompt_version, llm.model_name, content)
+    return content
+
 def merge_dict(left: dict, right: dict) -> dict:
     new_dict = left.copy()
     new_dict.update(right)
@@ -55,21 +96,51 @@ class GraphState(TypedDict):
     srt_content: str
     txt_content: str
     results: Annotated[dict, merge_dict]
+    # map 階段各時間窗的產出 (index, 內容)，由 operator.add 累加
+    window_minutes: Annotated[list, operator.add]
+    window_summaries: Annotated[list, operator.add]
+
+def fmt_clock(seconds: float) -> str:
+    return f"{int(seconds) // 3600:02d}:{int(seconds) % 3600 // 60:02d}:{int(seconds) % 60:02d}"
 
 def asr_node(state: GraphState):
     return {"results": {"status": "Processing"}}
 
 def minutes_taker_node(state: GraphState):
-    prompt = f"請將以下 SRT 內容轉為 Markdown 表格 (時間|發言內容):\n\n{state['srt_content']}"
-    res = llm.invoke(prompt)
-    return {"results": {"minutes": res.content}}
+    return {"results": {"minutes": cached_llm("minutes_taker", MINUTES_PROMPT, state['srt_content'])}}
 
 def summarizer_node(state: GraphState):
-    prompt = f"請摘要以下內容 (包含決策與待辦事項):\n\n{state['txt_content']}"
-    res = llm.invoke(prompt)
-    return {"results": {"summary": res.content}}
+    return {"results": {"summary": cached_llm("summarizer", SUMMARY_PROMPT, state['txt_content'])}}
+
+# --- 長逐字稿：map-reduce 路徑 ---
+def route_by_length(state: GraphState):
+    """短逐字稿走原本的單次呼叫；長逐字稿依時間窗平行 map"""
+    if estimate_tokens(state['txt_content']) <= SINGLE_SHOT_TOKENS:
+        return ["minutes_taker", "summarizer"]
+    windows = split_srt_windows(state['srt_content'], WINDOW_SEC)
+    if not windows:
+        # SRT 無法解析出時間窗時退回單次呼叫，確保 writer 一定會執行
+        print("⚠️ 無法從 SRT 切出時間窗，改用單次呼叫")
+        return ["minutes_taker", "summarizer"]
+    print(f"🧩 逐字稿過長，切成 {len(windows)} 個 {WINDOW_SEC // 60} 分鐘時間窗平行處理")
+    return [Send("window_minutes", w) for w in windows] + [Send("window_summary", w) for w in windows]
+
+def window_minutes_node(window: dict):
+    content = cached_llm("window_minutes", MINUTES_PROMPT, window['srt'])
+    return {"window_minutes": [(window['index'], window['start'], window['end'], content)]}
+
+def window_summary_node(window: dict):
+    content = cached_llm("window_summary", WINDOW_SUMMARY_PROMPT, window['txt'], start=fmt_clock(window['start']))
+    return {"window_summaries": [(window['index'], content)]}
+
+def reduce_node(state: GraphState):
+    minutes = "\n\n".join(f"### {fmt_clock(start)} – {fmt_clock(end)}\n{text}"
+                           for _, start, end, text in sorted(state['window_minutes']))
+    partials = "\n\n".join(f"[片段 {i + 1}]\n{text}" for i, text in sorted(state['window_summaries']))
+    return {"results": {"minutes": minutes, "summary": cached_llm("reduce", REDUCE_PROMPT, partials)}}
 
 def writer_node(state: GraphState):
+    # 報告模板只在這裡組裝、不呼叫 LLM；只改模板時上游節點全部命中快取
     summary = state["results"].get("summary", "")
     minutes = state["results"].get("minutes", "")
     # 依照圖片 40 格式組合
@@ -78,13 +149,18 @@ def writer_node(state: GraphState):
 
 # 建立圖結構
 workflow = StateGraph(GraphState)
-workflow.add_node("asr", asr_node)
-workflow.add_node("minutes_taker", minutes_taker_node)
-workflow.add_node("summarizer", summarizer_node)
-workflow.add_node("writer", writer_node)
+workflow.add_node("asr", tracer.wrap("asr", asr_node))
+workflow.add_node("minutes_taker", tracer.wrap("minutes_taker", minutes_taker_node))
+workflow.add_node("summarizer", tracer.wrap("summarizer", summarizer_node))
+workflow.add_node("window_minutes", tracer.wrap("window_minutes", window_minutes_node))
+workflow.add_node("window_summary", tracer.wrap("window_summary", window_summary_node))
+workflow.add_node("reduce", tracer.wrap("reduce", reduce_node))
+workflow.add_node("writer", tracer.wrap("writer", writer_node))
 workflow.set_entry_point("asr")
-workflow.add_edge("asr", "minutes_taker")
-workflow.add_edge("asr", "summarizer")
+workflow.add_conditional_edges("asr", route_by_length, ["minutes_taker", "summarizer", "window_minutes", "window_summary"])
+workflow.add_edge("window_minutes", "reduce")
+workflow.add_edge("window_summary", "reduce")
+workflow.add_edge("reduce", "writer")
 workflow.add_edge("minutes_taker", "writer")
 workflow.add_edge("summarizer", "writer")
 workflow.add_edge("writer", END)
@@ -98,7 +174,8 @@ srt_data, txt_data = get_asr_results() # 這裡會取得完整 20 秒內容
 if srt_data and txt_data:
     print("--- 智慧會議助理開始分析 ---")
     inputs = {"srt_content": srt_data, "txt_content": txt_data}
-    final_output = app.invoke(inputs)
+    with tracer.run(WAV_PATH):
+        final_output = app.invoke(inputs)
     
     report_content = final_output["results"]["final_report"]
     
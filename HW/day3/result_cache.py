@@ -0,0 +1,77 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Optional, Tuple
+
+
+def file_hash(path: str, chunk_size: int = 1 << 20) -> str:
+    """分塊讀取檔案計算 sha256，長音檔也不必整檔載入記憶體。"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class MeetingCache:
+    """會議報告流程的結果快取 (SQLite)。
+
+    - transcripts：以音檔內容雜湊為鍵，存 SRT / TXT，同一檔案不必再跑 ASR
+    - outputs：以 (節點, 輸入逐字稿雜湊, prompt 版本, 模型) 為鍵，存各 LLM 節點的輸出
+    只改某個節點的 prompt 時，其他節點與 ASR 都能直接命中。
+    """
+
+    def __init__(self, path: str):
+        self.stats = {"transcript_hit": 0, "output_hit": 0, "miss": 0}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS transcripts (
+                audio_hash TEXT PRIMARY KEY,
+                srt TEXT NOT NULL,
+                txt TEXT NOT NULL,
+                created REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS outputs (
+                node TEXT NOT NULL,
+                input_hash TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                model TEXT NOT NULL,
+                output TEXT NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (node, input_hash, prompt_version, model)
+            );
+        """)
+        self._db.commit()
+
+    def get_transcript(self, audio_hash: str) -> Optional[Tuple[str, str]]:
+        with self._lock:
+            row = self._db.execute("SELECT srt, txt FROM transcripts WHERE audio_hash = ?",
+                                   (audio_hash,)).fetchone()
+            self.stats["transcript_hit" if row else "miss"] += 1
+        return tuple(row) if row else None
+
+    def put_transcript(self, audio_hash: str, srt: str, txt: str):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO transcripts VALUES (?, ?, ?, ?)",
+                             (audio_hash, srt, txt, time.time()))
+            self._db.commit()
+
+    def get_output(self, node: str, input_hash: str, prompt_version: str, model: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT output FROM outputs WHERE node = ? AND input_hash = ? AND prompt_version = ? AND model = ?",
+                (node, input_hash, prompt_version, model)).fetchone()
+            self.stats["output_hit" if row else "miss"] += 1
+        return row[0] if row else None
+
+    def put_output(self, node: str, input_hash: str, prompt_version: str, model: str, output: str):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?, ?, ?)",
+                             (node, input_hash, prompt_version, model, output, time.time()))
+            self._db.commit()
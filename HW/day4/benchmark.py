@@ -0,0 +1,281 @@
+"""day4 查證代理人的離線壓測工具。
+
+在本機啟動三個替身服務，不需任何外部網路即可量測 HW/day4/day4-hw.py 的 app：
+  - 假 SearXNG：回傳指向本機靜態網站的 JSON 搜尋結果
+  - 本機靜態網站：一般文章頁 (走文字層) 與圖片頁 (走截圖 + VLM 層)
+  - 腳本化的 OpenAI 相容 LLM 伺服器 (含 /embed)，延遲可調
+
+用法：
+    python HW/day4/benchmark.py --questions 8 --concurrency 4 --llm-latency 0.2
+"""
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+import tempfile
+import threading
+import importlib.util
+from statistics import mean
+from urllib.parse import urlparse, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+NUM_PAGES = 12
+
+# --- 1. 替身服務 ---
+
+def start_server(handler_cls):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler_cls)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def make_site_handler():
+    class SiteHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            m = re.match(r"/page/(\d+)\.html", self.path)
+            if not m:
+                self.send_error(404)
+                return
+            k = int(m.group(1))
+            if k % 4 == 3:
+                # 圖多字少的頁面，會升級到截圖 + VLM 路徑
+                body = "".join(f'<svg width="300" height="200"><rect width="300" height="200" fill="#{k:02d}{i:02d}aa"/></svg>'
+                               for i in range(8))
+            else:
+                body = "<article>" + "".join(
+                    f"<p>第 {k} 篇報導第 {i} 段：測試事件於 2025 年發生，相關單位公布了第 {k * 10 + i} 項統計數據，"
+                    f"並說明後續處理流程與影響範圍。</p>" for i in range(12)) + "</article>"
+            html = f"<html><head><meta charset='utf-8'><title>測試頁 {k}</title></head><body>{body}</body></html>"
+            data = html.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return SiteHandler
+
+
+def make_searxng_handler(site_url):
+    class SearxngHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            q = parse_qs(urlparse(self.path).query).get("q", [""])[0]
+            seed = int(hashlib.md5(q.encode("utf-8")).hexdigest(), 16)
+            pages = [(seed + i * 5) % NUM_PAGES for i in range(3)]
+            results = [{"title": f"測試頁 {k}", "url": f"{site_url}/page/{k}.html", "content": q} for k in pages]
+            data = json.dumps({"query": q, "results": results}, ensure_ascii=False).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return SearxngHandler
+
+
+def fake_embedding(text, dim=64):
+    """以字元 bigram 雜湊產生的確定性向量，相似的文字會得到相近的向量。"""
+    vec = [0.0] * dim
+    for a, b in zip(text, text[1:]):
+        vec[int(hashlib.md5((a + b).encode("utf-8")).hexdigest(), 16) % dim] += 1.0
+    norm = sum(v * v for v in vec) ** 0.5 or 1.0
+    return [v / norm for v in vec]
+
+
+def make_llm_handler(latency, token_delay, planner_yes_at):
+    planner_calls = {}
+    lock = threading.Lock()
+
+    def script_reply(messages):
+        content = messages[-1]["content"]
+        if isinstance(content, list):
+            # 多模態 (截圖) 請求
+            return "- 截圖顯示一張統計圖表\n- 圖表數據於 2025 年更新\n- 來源為測試單位"
+        if "JSON 格式回傳" in content:
+            q = re.search(r"問題：(.+)", content)
+            key = q.group(1).strip() if q else ""
+            with lock:
+                planner_calls[key] = planner_calls.get(key, 0) + 1
+                n = planner_calls[key]
+            ok = "YES" if n >= planner_yes_at else "NO"
+            return json.dumps({"sufficient": ok, "feedback": "需要更多統計數據"}, ensure_ascii=False)
+        if "搜尋關鍵字" in content:
+            q = re.search(r"問題：'(.+?)'", content)
+            base = q.group(1) if q else "測試"
+            return "\n".join(f"{base} 角度{i}" for i in range(1, 4))
+        if "資料處理專家" in content:
+            return "\n".join(f"- 事實 {random.randint(0, 50)}：測試事件的第 {i} 項統計數據已公布" for i in range(5))
+        if "專業、客觀的報告" in content:
+            return "查證報告：" + "根據多個來源交叉比對，測試事件的相關數據屬實。" * 20
+        return "- 網頁提到測試事件於 2025 年發生\n- 相關單位公布了統計數據"
+
+    class LLMHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, obj):
+            data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self.path.rstrip("/").endswith("/embed"):
+                self._send_json({"embeddings": [fake_embedding(t) for t in body.get("texts", [])]})
+                return
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self.send_error(404)
+                return
+
+            time.sleep(latency)
+            text = script_reply(body["messages"])
+            model = body.get("model", "fake")
+            usage = {"prompt_tokens": len(json.dumps(body["messages"])) // 4,
+                     "completion_tokens": len(text), "total_tokens": 0}
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+            if not body.get("stream"):
+                self._send_json({
+                    "id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                    "usage": usage,
+                })
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            pieces = [text[i:i + 8] for i in range(0, len(text), 8)] + [None]
+            for piece in pieces:
+                delta = {"content": piece} if piece is not None else {}
+                chunk = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": model,
+                         "choices": [{"index": 0, "delta": delta, "finish_reason": None if piece is not None else "stop"}]}
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(token_delay)
+            if (body.get("stream_options") or {}).get("include_usage"):
+                # 與 OpenAI 相同：最後一個 chunk 的 choices 為空，只帶 usage
+                chunk = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": model, "choices": [], "usage": usage}
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.write(b"data: [DONE]\n\n")
+
+    return LLMHandler
+
+# --- 2. 量測 ---
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    idx = min(len(values) - 1, max(0, int(round(p / 100 * (len(values) - 1)))))
+    return values[idx]
+
+
+def load_agent():
+    # 檔名含連字號，無法直接 import
+    spec = importlib.util.spec_from_file_location("day4_hw", os.path.join(BASE_DIR, "day4-hw.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_question(agent, question):
+    node_times = {}
+    state = {"count": 0}
+    t0 = last = time.perf_counter()
+    inputs = {"question": question, "knowledge_base": "", "cache_hit": False, "count": 0, "decision": ""}
+    # 流程為單線執行，相鄰兩次 updates 的時間差即為該節點耗時
+    # 每題包在 tracer.run 中：追蹤紀錄帶有 run_id，統計在題目結束時釋放
+    with agent.tracer.run(question, summary=False):
+        for update in agent.app.stream(inputs, stream_mode="updates"):
+            now = time.perf_counter()
+            for node, data in update.items():
+                node_times.setdefault(node, []).append(now - last)
+                if data:
+                    state.update(data)
+            last = now
+    return {"latency": last - t0, "node_times": node_times, "loops": state.get("count", 0),
+            "cache_hit": state.get("cache_hit", False)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="day4 查證代理人離線壓測")
+    parser.add_argument("--questions", type=int, default=8, help="問題數")
+    parser.add_argument("--concurrency", type=int, default=4, help="同時執行的問題數")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="每次 LLM 呼叫的固定延遲 (秒)")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="串流時每段 token 的延遲 (秒)")
+    parser.add_argument("--planner-yes-at", type=int, default=2, help="第幾次 Planner 評估時回答 YES")
+    parser.add_argument("--repeat", type=int, default=1, help="重複題組次數 (>1 可量測快取命中後的表現)")
+    parser.add_argument("--output", help="將結果另存為 JSON")
+    args = parser.parse_args()
+
+    _, site_url = start_server(make_site_handler())
+    _, searxng_url = start_server(make_searxng_handler(site_url))
+    _, llm_url = start_server(make_llm_handler(args.llm_latency, args.token_delay, args.planner_yes_at))
+
+    os.environ["SEARXNG_URL"] = f"{searxng_url}/search"
+    os.environ["EMBED_API_URL"] = f"{llm_url}/embed"
+    os.environ["LLM_BASE_URL"] = f"{llm_url}/v1"
+    os.environ["CACHE_DIR"] = tempfile.mkdtemp(prefix="day4-bench-")
+    agent = load_agent()
+
+    questions = [f"第 {i} 號測試事件的統計數據是否屬實？" for i in range(args.questions)] * args.repeat
+    print(f"🚀 開始壓測：{len(questions)} 題，並行 {args.concurrency}，LLM 延遲 {args.llm_latency}s")
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        runs = list(pool.map(lambda q: run_question(agent, q), questions))
+    wall = time.perf_counter() - t0
+
+    latencies = [r["latency"] for r in runs]
+    per_node = {}
+    for r in runs:
+        for node, times in r["node_times"].items():
+            per_node.setdefault(node, []).extend(times)
+
+    print("\n" + "=" * 20 + " 節點延遲 (秒) " + "=" * 20)
+    print(f"{'節點':<18}{'次數':>6}{'平均':>10}{'p50':>10}{'p95':>10}")
+    for node, times in per_node.items():
+        print(f"{node:<18}{len(times):>6}{mean(times):>10.3f}{percentile(times, 50):>10.3f}{percentile(times, 95):>10.3f}")
+
+    summary = {
+        "questions": len(questions),
+        "concurrency": args.concurrency,
+        "e2e_p50": percentile(latencies, 50),
+        "e2e_p95": percentile(latencies, 95),
+        "avg_loops": mean(r["loops"] for r in runs),
+        "cache_hits": sum(1 for r in runs if r["cache_hit"]),
+        "throughput_qps": len(questions) / wall,
+        "wall_time": wall,
+        "page_cache": dict(agent.page_cache.stats),
+        "nodes": {n: {"count": len(t), "mean": mean(t), "p50": percentile(t, 50), "p95": percentile(t, 95)}
+                  for n, t in per_node.items()},
+    }
+    print("\n" + "=" * 20 + " 整體 " + "=" * 20)
+    print(f"端到端 p50: {summary['e2e_p50']:.3f}s | p95: {summary['e2e_p95']:.3f}s")
+    print(f"平均搜尋輪數: {summary['avg_loops']:.2f} | 快取命中: {summary['cache_hits']}/{len(questions)}")
+    print(f"吞吐量: {summary['throughput_qps']:.3f} 題/秒 (總耗時 {wall:.2f}s)")
+    print(f"網頁快取: {summary['page_cache']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        print(f"✅ 結果已儲存至: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
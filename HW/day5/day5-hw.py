@@ -1,5 +1,8 @@
 import os
+import sys
+import glob
 import uuid
+import threading
 import pandas as pd
 import requests
 import time
@@ -8,38 +11,44 @@ from qdrant_client.models import Distance, VectorParams, PointStruct
 
 # === 修正後的 Import ===
 from langchain_text_splitters import RecursiveCharacterTextSplitter, CharacterTextSplitter
-from langchain_experimental.text_splitter import SemanticChunker
 
 # === 0. 配置與初始化 ===
 API_KEY = "YOUR_API_KEY" 
-EMBED_API_URL = "https://ws-04.wade0426.me/embed"
-SUBMIT_URL = "https://hw-01.wade0426.me/submit_answer"
+# 端點與資料位置可用環境變數覆寫 (離線壓測時搭配 make_corpus.py 與 embed_server.py)
+EMBED_API_URL = os.environ.get("EMBED_API_URL", "https://ws-04.wade0426.me/embed")
+SUBMIT_URL = os.environ.get("SUBMIT_URL", "https://hw-01.wade0426.me/submit_answer")  # 設為空字串則不評分
+QDRANT_URL = os.environ.get("QDRANT_URL", "http://localhost:6333")  # ":memory:" 為本機記憶體模式
 CHUNK_SIZE = 300
 CHUNK_OVERLAP = 50
+SEMANTIC_PERCENTILE = 95
+# 語義切塊的 chunk 向量直接由句向量加權平均而得，不再送第二次 embedding (檢索品質略有差異，預設關閉)
+POOL_SEMANTIC_VECTORS = os.environ.get("POOL_SEMANTIC_VECTORS", "0") == "1"
+EMBED_BATCH = 128          # 匯入管線每次送 embedding 的 chunk 數 (用戶端會再切成小批並行)
+UPSERT_BATCH = 256         # 每次寫入 Qdrant 的點數
+PIPELINE_QUEUE_SIZE = 16   # 階段間佇列容量，決定背壓與記憶體上限
 
 # 取得程式碼所在目錄，確保路徑正確
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.environ.get("DATA_DIR", BASE_DIR)
+# 讓子資料夾腳本也能匯入根目錄的 common 共用模組
+sys.path.append(os.path.dirname(os.path.dirname(BASE_DIR)))
+from common.embed_client import EmbeddingClient
+from common.embed_cache import EmbeddingCache
+from common.semantic_chunker import SemanticSplitter
+from common.pipeline import Pipeline
 
-client = QdrantClient(url="http://localhost:6333")
+# 小批次、多路並行送出；失敗的批次切半重試，不會因一次逾時就丟掉整個集合
+# 向量先查本地內容雜湊快取，資料沒變時重跑不會再呼叫 embedding API
+embedder = EmbeddingClient(EMBED_API_URL, normalize=True, max_batch=32, workers=4, timeout=60,
+                           cache=EmbeddingCache())
 
-class CustomEmbeddings:
-    def embed_documents(self, texts): return get_embeddings(texts)
-    def embed_query(self, text): return get_embeddings([text])[0]
+client = QdrantClient(location=QDRANT_URL)
 
 # === 1. 功能函數 ===
 
-def get_embeddings(texts):
-    if not texts: return []
-    payload = {"texts": texts, "normalize": True, "batch_size": 32}
-    try:
-        response = requests.post(EMBED_API_URL, json=payload, timeout=60)
-        response.raise_for_status()
-        return response.json()['embeddings']
-    except Exception as e:
-        print(f"❌ Embedding API 錯誤: {e}")
-        return []
-
 def submit_and_get_score(q_id, answer):
+    if not SUBMIT_URL:
+        return 0
     payload = {"q_id": q_id, "student_answer": answer}
     try:
         response = requests.post(SUBMIT_URL, json=payload, timeout=20)
@@ -49,61 +58,127 @@ def submit_and_get_score(q_id, answer):
 
 # === 2. 檔案處理與切塊 ===
 
-def process_files_and_chunk():
-    data_files = [f"data_0{i}.txt" for i in range(1, 6)]
-    all_chunks_data = {"固定大小": [], "滑動視窗": [], "語義切塊": []}
-    embeddings_tool = CustomEmbeddings()
-    
-    semantic_sub_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=0)
-    
-    print("\n" + "="*20 + " 1. 開始檔案切塊階段 " + "="*20)
-    for file_name in data_files:
-        # 使用絕對路徑尋找文本檔案
-        full_path = os.path.join(BASE_DIR, file_name)
-        if not os.path.exists(full_path):
-            print(f"⚠️ 找不到檔案: {full_path}")
-            continue
-            
-        with open(full_path, "r", encoding="utf-8") as f:
-            content = f.read()
-        
-        print(f"📄 讀取檔案: {file_name} ({len(content)} 字)")
-        
+METHOD_TO_COLL = {
+    "固定大小": "coll_fixed_size",
+    "滑動視窗": "coll_sliding_window",
+    "語義切塊": "coll_semantic_chunk"
+}
+
+def iter_data_files():
+    yield from sorted(glob.glob(os.path.join(DATA_DIR, "data_*.txt")))
+
+def read_file(full_path):
+    with open(full_path, "r", encoding="utf-8") as f:
+        yield {"source": os.path.basename(full_path), "content": f.read()}
+
+def make_chunker(methods):
+    """回傳逐檔切塊的函數，只產生 methods 內方法的 chunk。"""
+    f_splitter = CharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=0, separator="")
+    s_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    # 每句只 embed 一次 (經快取)，斷點以 NumPy 向量化計算，段內依句子邊界裝箱到 CHUNK_SIZE
+    sem_splitter = SemanticSplitter(embedder.embed, percentile=SEMANTIC_PERCENTILE, max_chars=CHUNK_SIZE)
+
+    def chunk_file(doc):
+        content, file_name = doc["content"], doc["source"]
         # 1. 固定大小
-        f_splitter = CharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=0, separator="")
-        for c in [d.page_content for d in f_splitter.create_documents([content])]:
-            all_chunks_data["固定大小"].append({"text": c, "source": file_name})
-        
+        if "固定大小" in methods:
+            for c in f_splitter.split_text(content):
+                yield {"method": "固定大小", "text": c, "source": file_name}
         # 2. 滑動視窗
-        s_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
-        for c in [d.page_content for d in s_splitter.create_documents([content])]:
-            all_chunks_data["滑動視窗"].append({"text": c, "source": file_name})
-        
-        # 3. 語義切塊
-        sem_splitter = SemanticChunker(
-            embeddings_tool, 
-            breakpoint_threshold_type="percentile",
-            breakpoint_threshold_amount=95
-        )
-        sem_base_docs = sem_splitter.create_documents([content])
-        
-        for doc in sem_base_docs:
-            if len(doc.page_content) > CHUNK_SIZE:
-                sub_docs = semantic_sub_splitter.split_text(doc.page_content)
-                for sub_c in sub_docs:
-                    all_chunks_data["語義切塊"].append({"text": sub_c, "source": file_name})
+        if "滑動視窗" in methods:
+            for c in s_splitter.split_text(content):
+                yield {"method": "滑動視窗", "text": c, "source": file_name}
+        # 3. 語義切塊 (句向量取不到時拋出 EmbeddingError，整條匯入管線中止)
+        if "語義切塊" in methods:
+            if POOL_SEMANTIC_VECTORS:
+                sem_chunks, sem_vectors = sem_splitter.split_with_vectors(content)
+                for c, vec in zip(sem_chunks, sem_vectors):
+                    yield {"method": "語義切塊", "text": c, "source": file_name, "vector": vec}
             else:
-                all_chunks_data["語義切塊"].append({"text": doc.page_content, "source": file_name})
-        
+                for c in sem_splitter.split(content):
+                    yield {"method": "語義切塊", "text": c, "source": file_name}
+
+    return chunk_file
+
+def process_files_and_chunk():
+    """一次取得所有 chunk (小語料檢查用；正式匯入請走 ingest_collections 的串流管線)"""
+    all_chunks_data = {method: [] for method in METHOD_TO_COLL}
+    chunk_file = make_chunker(set(METHOD_TO_COLL))
+    for full_path in iter_data_files():
+        for doc in read_file(full_path):
+            for item in chunk_file(doc):
+                all_chunks_data[item.pop("method")].append(item)
     return all_chunks_data
 
+def embed_chunks(batch):
+    # 語義切塊若已由句向量彙整出向量就不再送出
+    todo = [item for item in batch if "vector" not in item]
+    if todo:
+        # 重試後仍失敗就拋出 EmbeddingError 中止管線，不留下缺漏的集合
+        vectors = embedder.embed([item["text"] for item in todo])
+        for item, vec in zip(todo, vectors):
+            item["vector"] = vec
+    return batch
+
+def make_upserter():
+    created = set()
+    lock = threading.Lock()
+
+    def upsert(batch):
+        by_coll = {}
+        for item in batch:
+            by_coll.setdefault(METHOD_TO_COLL[item["method"]], []).append(item)
+        for coll_name, items in by_coll.items():
+            with lock:
+                if coll_name not in created:
+                    client.create_collection(
+                        collection_name=coll_name,
+                        vectors_config=VectorParams(size=len(items[0]["vector"]), distance=Distance.COSINE)
+                    )
+                    created.add(coll_name)
+            points = [
+                PointStruct(
+                    id=uuid.uuid4().hex,
+                    vector=item["vector"],
+                    payload={"text": item["text"], "source": item["source"]}
+                ) for item in items
+            ]
+            client.upsert(collection_name=coll_name, points=points)
+        return ()
+
+    return upsert
+
+def ingest_collections(methods):
+    """讀檔 → 切塊 → embedding → 上傳 串流進行，各段以有界佇列相接，記憶體不隨語料增長"""
+    print("\n" + "="*20 + " 1. 串流切塊與匯入階段 " + "="*20)
+    pipeline = (
+        Pipeline("day5 匯入", queue_size=PIPELINE_QUEUE_SIZE)
+        .stage("read", read_file)
+        .stage("chunk", make_chunker(methods), workers=2)
+        .stage("embed", embed_chunks, workers=2, batch_size=EMBED_BATCH)
+        .stage("upsert", make_upserter(), workers=2, batch_size=UPSERT_BATCH)
+    )
+    try:
+        pipeline.run(iter_data_files())
+    except BaseException:
+        # 匯入中途失敗：刪掉這次建立的集合，下次執行時會整個重建，而不是沿用只有部分資料的集合
+        for method in methods:
+            coll_name = METHOD_TO_COLL[method]
+            if client.collection_exists(collection_name=coll_name):
+                client.delete_collection(collection_name=coll_name)
+                print(f"🗑️ {coll_name} 匯入未完成，已刪除")
+        raise
+    for method in methods:
+        if client.collection_exists(collection_name=METHOD_TO_COLL[method]):
+            print(f"✅ {METHOD_TO_COLL[method]} 初始化完成。")
+
 # === 3. 向量檢索與評分 ===
 
 def setup_vdb_and_search():
     results_for_csv = []
     
     # --- 修正路徑與欄位名稱問題 ---
-    questions_path = os.path.join(BASE_DIR, "questions.csv")
+    questions_path = os.path.join(DATA_DIR, "questions.csv")
     if not os.path.exists(questions_path):
         raise FileNotFoundError(f"❌ 找不到題目檔: {questions_path}")
         
@@ -121,47 +196,22 @@ def setup_vdb_and_search():
     q_texts = questions_df[target_q_col].astype(str).tolist()
     q_ids = questions_df[target_id_col].tolist()
     
-    method_to_coll = {
-        "固定大小": "coll_fixed_size",
-        "滑動視窗": "coll_sliding_window",
-        "語義切塊": "coll_semantic_chunk"
-    }
-    
     print(f"\n📡 正在批量獲取 {len(q_texts)} 個問題的向量...")
-    all_q_vectors = get_embeddings(q_texts)
+    # 取不到問題向量時直接拋出 EmbeddingError，而不是跑完零題卻看似成功
+    all_q_vectors = embedder.embed(q_texts)
     
-    all_chunks_data = None 
+    # 三種切法共用一次讀檔，只匯入尚未建立的集合
+    missing = {m for m, coll in METHOD_TO_COLL.items() if not client.collection_exists(collection_name=coll)}
+    if missing:
+        ingest_collections(missing)
 
     print("\n" + "="*20 + " 2. 向量檢索與評分階段 " + "="*20)
 
-    for method, coll_name in method_to_coll.items():
+    for method, coll_name in METHOD_TO_COLL.items():
         print(f"\n🛠️ 正在處理方法: [{method}]")
-        
         if not client.collection_exists(collection_name=coll_name):
-            if all_chunks_data is None:
-                all_chunks_data = process_files_and_chunk()
-            
-            chunk_items = all_chunks_data[method]
-            texts = [item['text'] for item in chunk_items]
-            sources = [item['source'] for item in chunk_items]
-            
-            chunk_vectors = get_embeddings(texts)
-            if not chunk_vectors: continue
-
-            client.create_collection(
-                collection_name=coll_name,
-                vectors_config=VectorParams(size=len(chunk_vectors[0]), distance=Distance.COSINE)
-            )
-            
-            points = [
-                PointStruct(
-                    id=uuid.uuid4().hex, 
-                    vector=chunk_vectors[i], 
-                    payload={"text": texts[i], "source": sources[i]}
-                ) for i in range(len(texts))
-            ]
-            client.upsert(collection_name=coll_name, points=points)
-            print(f"✅ {coll_name} 初始化完成。")
+            print(f"⚠️ {coll_name} 沒有任何資料，略過")
+            continue
 
         for i, q_vec in enumerate(all_q_vectors):
             search_res = client.query_points(
@@ -0,0 +1,123 @@
+"""day5 的本機 /embed 替身服務。
+
+請求 / 回應格式與 https://ws-04.wade0426.me/embed 相同：
+    POST /embed  {"texts": [...], "normalize": true, "task_description": "...", "batch_size": 32}
+    →            {"embeddings": [[...], ...]}
+
+向量由字元 bigram 雜湊而成 (只依賴 NumPy)：同一段文字永遠得到同一個向量，
+字面相近的文字向量也相近，足以讓切塊、檢索與 Qdrant 上傳流程在離線下跑出合理結果。
+task_description 不影響向量。可模擬延遲、隨機失敗與批次上限，用來測試用戶端的重試與切批。
+
+用法：
+    python HW/day5/embed_server.py --port 8765 --dim 256 --per-text 0.001
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+
+MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def embed_text(text, dim, normalize=True):
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    vec = np.zeros(dim, dtype=np.float32)
+    if len(codes) >= 2:
+        # bigram → 64-bit 乘法雜湊：高 32 位元決定維度、最高位決定正負號
+        keys = (codes[:-1] << np.uint64(21)) ^ codes[1:]
+        hashed = keys * MULTIPLIER
+        index = (hashed >> np.uint64(32)) % np.uint64(dim)
+        sign = np.where(hashed >> np.uint64(63), -1.0, 1.0)
+        vec = np.bincount(index.astype(np.int64), weights=sign, minlength=dim).astype(np.float32)
+    elif len(codes) == 1:
+        vec[int(codes[0]) % dim] = 1.0
+    if normalize:
+        norm = np.linalg.norm(vec)
+        if norm:
+            vec /= norm
+    return vec
+
+
+def make_handler(dim, latency, per_text, fail_rate, max_batch):
+    stats = {"requests": 0, "texts": 0, "failed": 0}
+    lock = threading.Lock()
+
+    class EmbedHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, status, body):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                with lock:
+                    self._reply(200, {"status": "ok", "dim": dim, **stats})
+            else:
+                self._reply(404, {"detail": "not found"})
+
+        def do_POST(self):
+            if self.path != "/embed":
+                self._reply(404, {"detail": "not found"})
+                return
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            texts = payload.get("texts") or []
+            with lock:
+                stats["requests"] += 1
+            if max_batch and len(texts) > max_batch:
+                self._reply(413, {"detail": f"batch too large: {len(texts)} > {max_batch}"})
+                return
+            time.sleep(latency + per_text * len(texts))
+            if fail_rate and random.random() < fail_rate:
+                with lock:
+                    stats["failed"] += 1
+                self._reply(503, {"detail": "simulated failure"})
+                return
+            normalize = payload.get("normalize", True)
+            vectors = [embed_text(t, dim, normalize).tolist() for t in texts]
+            with lock:
+                stats["texts"] += len(texts)
+            self._reply(200, {"embeddings": vectors})
+
+    return EmbedHandler
+
+
+def start_server(handler_cls, host="127.0.0.1", port=0):
+    server = ThreadingHTTPServer((host, port), handler_cls)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="day5 本機 /embed 替身服務")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--dim", type=int, default=256, help="向量維度")
+    parser.add_argument("--latency", type=float, default=0.0, help="每個請求的固定延遲 (秒)")
+    parser.add_argument("--per-text", type=float, default=0.0, help="每筆文字額外的延遲 (秒)")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="隨機回傳 503 的機率")
+    parser.add_argument("--max-batch", type=int, default=0, help="單次請求筆數上限，超過回 413 (0 為不限)")
+    args = parser.parse_args()
+
+    handler = make_handler(args.dim, args.latency, args.per_text, args.fail_rate, args.max_batch)
+    server, url = start_server(handler, args.host, args.port)
+    print(f"🧪 本機 embedding 服務: {url}/embed (維度 {args.dim})，Ctrl+C 結束")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""day5 大規模語料產生器。
+
+以 HW/day5/data_0*.txt 與 questions.csv 為樣本，產生 1 萬 ~ 100 萬個 chunk 規模的語料：
+  - 每份文件從某篇樣本的隨機位置起，連續取句子 (保留主題連貫，語義切塊才有意義)
+  - 句中數字依文件編號偏移、段落加上編號，每份文件內容都不同，不會被 embedding 快取整批命中
+  - 同一組參數 (含 --seed) 產出的檔案內容完全相同
+
+用法：
+    python HW/day5/make_corpus.py --chunks 100000 --out /tmp/day5-corpus
+    DATA_DIR=/tmp/day5-corpus EMBED_API_URL=http://127.0.0.1:8765/embed QDRANT_URL=:memory: \\
+        SUBMIT_URL= python HW/day5/day5-hw.py
+"""
+import os
+import re
+import csv
+import glob
+import json
+import math
+import time
+import random
+import argparse
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SENTENCE_RE = re.compile(r"[^。！？\n]+[。！？]?")
+NUMBER_RE = re.compile(r"\d+")
+
+
+def load_sentences(sample_dir):
+    docs = []
+    for path in sorted(glob.glob(os.path.join(sample_dir, "data_0*.txt"))):
+        with open(path, "r", encoding="utf-8-sig") as f:
+            sentences = [s.strip() for s in SENTENCE_RE.findall(f.read()) if s.strip()]
+        if sentences:
+            docs.append(sentences)
+    if not docs:
+        raise FileNotFoundError(f"❌ 找不到樣本文件: {sample_dir}/data_0*.txt")
+    return docs
+
+
+def load_questions(sample_dir):
+    with open(os.path.join(sample_dir, "questions.csv"), "r", encoding="utf-8-sig") as f:
+        rows = list(csv.DictReader(f))
+    return [r.get("questions") or r.get("question") for r in rows if r.get("questions") or r.get("question")]
+
+
+def shift_numbers(text, offset):
+    return NUMBER_RE.sub(lambda m: str(int(m.group()) + offset), text) if offset else text
+
+
+def make_document(docs, doc_id, doc_chars, rng):
+    source = docs[rng.randrange(len(docs))]
+    pos = rng.randrange(len(source))
+    parts, size = [f"【文件 {doc_id}】"], 0
+    paragraph = []
+    while size < doc_chars:
+        # 偶爾跳過句子，增加句子組合的變化
+        if rng.random() >= 0.1:
+            sentence = shift_numbers(source[pos], doc_id)
+            paragraph.append(sentence)
+            size += len(sentence)
+        pos += 1
+        if paragraph and (pos >= len(source) or rng.random() < 0.15):
+            # 段落編號讓不同文件的同一段樣本也不會切出完全相同的 chunk
+            parts.append(f"（{doc_id}-{len(parts)}）" + "".join(paragraph))
+            paragraph = []
+        if pos >= len(source):
+            # 樣本讀完就換下一篇，讓長文件也有主題轉換可以切
+            source = docs[rng.randrange(len(docs))]
+            pos = 0
+    if paragraph:
+        parts.append(f"（{doc_id}-{len(parts)}）" + "".join(paragraph))
+    return "\n\n".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="day5 大規模語料產生器")
+    parser.add_argument("--chunks", type=int, default=10000, help="目標 chunk 數 (依 chunk-size 換算總字數)")
+    parser.add_argument("--chunk-size", type=int, default=300, help="換算用的 chunk 字數，與 day5-hw 的 CHUNK_SIZE 相同")
+    parser.add_argument("--doc-chars", type=int, default=20000, help="每份文件的字數")
+    parser.add_argument("--questions", type=int, default=500, help="產生的問題數")
+    parser.add_argument("--sample-dir", default=BASE_DIR, help="樣本 data_0*.txt 與 questions.csv 所在資料夾")
+    parser.add_argument("--out", required=True, help="輸出資料夾")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    docs = load_sentences(args.sample_dir)
+    questions = load_questions(args.sample_dir)
+    os.makedirs(args.out, exist_ok=True)
+    rng = random.Random(args.seed)
+
+    num_docs = math.ceil(args.chunks * args.chunk_size / args.doc_chars)
+    print(f"🧪 產生 {num_docs} 份文件 (約 {args.chunks} 個 chunk) 至 {args.out}")
+    t0 = time.perf_counter()
+    total_chars = 0
+    for doc_id in range(1, num_docs + 1):
+        text = make_document(docs, doc_id, args.doc_chars, rng)
+        with open(os.path.join(args.out, f"data_{doc_id:06d}.txt"), "w", encoding="utf-8") as f:
+            f.write(text)
+        total_chars += len(text)
+        if doc_id % 1000 == 0:
+            print(f"   📄 {doc_id}/{num_docs} 份 ({total_chars / 1e6:.1f}M 字)")
+
+    with open(os.path.join(args.out, "questions.csv"), "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["q_id", "questions", "answer", "source"])
+        for q_id in range(1, args.questions + 1):
+            # 第一輪保留原題，之後數字偏移；題目沒有數字時加上輪次，避免重複
+            base = questions[(q_id - 1) % len(questions)]
+            round_no = (q_id - 1) // len(questions)
+            question = shift_numbers(base, round_no)
+            if round_no and question == base:
+                question = f"{base}（{round_no}）"
+            writer.writerow([q_id, question, "", ""])
+
+    manifest = {"docs": num_docs, "chars": total_chars, "target_chunks": args.chunks,
+                "chunk_size": args.chunk_size, "questions": args.questions, "seed": args.seed}
+    with open(os.path.join(args.out, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    print(f"✅ 完成：{num_docs} 份文件、{total_chars / 1e6:.1f}M 字、{args.questions} 題，"
+          f"耗時 {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
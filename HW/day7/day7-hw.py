@@ -1,29 +1,28 @@
 import os
+import sys
 import ssl
 import docx
 import easyocr
 import pdfplumber
 import pandas as pd
 import numpy as np
-import requests
 from pdf2image import convert_from_path
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# 讓子資料夾腳本也能匯入根目錄的 common 共用模組
+sys.path.append(os.path.dirname(os.path.dirname(BASE_DIR)))
+from common.llm_client import get_endpoint
+
 # --- 1. 配置本地 LLM 模型 ---
 class LocalVLLM:
-    def __init__(self, model_name):
+    def __init__(self, model_name, base_url="https://ws-03.wade0426.me/v1"):
         self.model_name = model_name
+        # 共用 keep-alive 連線池與限流；RAG 生成需要時間，timeout 設 60 秒
+        self.endpoint = get_endpoint(base_url, timeout=60)
 
     def generate(self, prompt: str) -> str:
-        API_URL = "https://ws-03.wade0426.me/v1/chat/completions" 
-        payload = {
-            "model": self.model_name,
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.1
-        }
         try:
-            # 增加 timeout 到 60 秒，因為 RAG 生成需要時間
-            response = requests.post(API_URL, json=payload, timeout=60)
-            return response.json()['choices'][0]['message']['content']
+            return self.endpoint.complete(prompt, self.model_name, temperature=0.1)
         except Exception as e:
             return f"生成失敗: {str(e)}"
 
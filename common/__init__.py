@@ -0,0 +1 @@
+# 各作業腳本共用的工具模組 (快取、連線池、追蹤等)
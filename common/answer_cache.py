@@ -0,0 +1,107 @@
+import json
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+
+def cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    na = math.sqrt(sum(x * x for x in a))
+    nb = math.sqrt(sum(y * y for y in b))
+    return dot / (na * nb) if na and nb else 0.0
+
+
+class AnswerCache:
+    """以問題向量相似度查找過往已查證答案的持久化快取 (SQLite)。
+
+    - 相似度 >= threshold 視為命中
+    - 超過 ttl 秒的項目視為過期並刪除
+    - 超過 max_entries 時以 LRU (最後使用時間) 淘汰
+    - lookup 算過的問題向量會暫存，未命中後 store 同一題時不再重新 embedding
+    """
+
+    RECENT_VECTORS = 256
+
+    def __init__(self, path: str, embed_fn: Callable[[List[str]], List[List[float]]],
+                 threshold: float = 0.92, ttl: float = 7 * 24 * 3600, max_entries: int = 500):
+        self.embed_fn = embed_fn
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._recent = OrderedDict()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                question TEXT NOT NULL,
+                vector TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                knowledge_base TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._db.commit()
+
+    def _embed(self, question: str) -> Optional[List[float]]:
+        with self._lock:
+            vec = self._recent.get(question)
+        if vec is not None:
+            return vec
+        vectors = self.embed_fn([question])
+        if not vectors:
+            return None
+        with self._lock:
+            self._recent[question] = vectors[0]
+            while len(self._recent) > self.RECENT_VECTORS:
+                self._recent.popitem(last=False)
+        return vectors[0]
+
+    def _expire(self, now: float):
+        self._db.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl,))
+
+    def lookup(self, question: str) -> Optional[dict]:
+        """回傳最相似且超過門檻的快取項目，找不到則回傳 None。"""
+        vec = self._embed(question)
+        if vec is None:
+            return None
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            best, best_score = None, self.threshold
+            for row in self._db.execute("SELECT id, question, vector, answer, knowledge_base FROM answers"):
+                score = cosine(vec, json.loads(row[2]))
+                if score >= best_score:
+                    best, best_score = row, score
+            if best is None:
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE answers SET last_used = ? WHERE id = ?", (now, best[0]))
+            self._db.commit()
+        return {"question": best[1], "answer": best[3], "knowledge_base": best[4], "score": best_score}
+
+    def store(self, question: str, answer: str, knowledge_base: str, vec: Optional[List[float]] = None):
+        """寫入一筆答案；vec 未給時沿用 lookup 算過的向量，都沒有才重新 embedding。"""
+        if vec is None:
+            vec = self._embed(question)
+        if vec is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO answers (question, vector, answer, knowledge_base, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (question, json.dumps(vec), answer, knowledge_base, now, now),
+            )
+            self._expire(now)
+            # 超過容量時刪除最久未使用的項目
+            self._db.execute("""
+                DELETE FROM answers WHERE id IN (
+                    SELECT id FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+            self._db.commit()
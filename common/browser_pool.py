@@ -0,0 +1,165 @@
+import atexit
+import queue
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from playwright.sync_api import sync_playwright
+
+_CLOSE = object()
+
+
+class _Slot:
+    """一個可重複使用的 context + page，並記錄已導覽次數。"""
+
+    def __init__(self, browser, viewport):
+        self.context = browser.new_context(viewport=viewport)
+        self.page = self.context.new_page()
+        self.uses = 0
+
+    def healthy(self) -> bool:
+        return not self.page.is_closed()
+
+    def close(self):
+        try:
+            self.context.close()
+        except Exception:
+            pass
+
+
+class _Worker:
+    """單一執行緒專屬的常駐 Chromium (Playwright sync API 不可跨執行緒共用)。"""
+
+    def __init__(self, headless, launch_args):
+        self.pw = sync_playwright().start()
+        try:
+            self.browser = self.pw.chromium.launch(headless=headless, args=launch_args)
+        except Exception:
+            self.pw.stop()
+            raise
+        self.slot = None
+
+    def close(self):
+        if self.slot is not None:
+            self.slot.close()
+            self.slot = None
+        try:
+            self.browser.close()
+        finally:
+            self.pw.stop()
+
+
+class BrowserPool:
+    """固定 size 條執行緒，每條各持有一個常駐瀏覽器，並重複使用其中的 context/page。
+
+    - 以 submit() 把工作交給池內執行緒，工作中用 lease() 借出該執行緒的 page
+    - 冷啟動成本每個執行緒只付一次
+    - page 導覽 max_uses 次後回收重建，避免記憶體累積；discard() 可丟棄狀態不明的 page
+    - 瀏覽器斷線或 page 已關閉時自動重建
+    - close() (程式結束時由 atexit 呼叫) 讓每條執行緒各自關閉自己的瀏覽器
+    """
+
+    def __init__(self, size: int = 4, headless: bool = True, max_uses: int = 50,
+                 viewport: dict = None, launch_args: list = None, name: str = "page"):
+        self.size = size
+        self.headless = headless
+        self.max_uses = max_uses
+        self.viewport = viewport or {'width': 1280, 'height': 800}
+        self.launch_args = launch_args or []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._tasks = queue.Queue()
+        self._closed = False
+        self.launches = 0
+        self.recycled = 0
+        self._threads = [threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True)
+                         for i in range(size)]
+        for t in self._threads:
+            t.start()
+        atexit.register(self.close)
+
+    def submit(self, fn, *args) -> Future:
+        """在池內執行緒上執行 fn(*args)，回傳 concurrent.futures.Future。"""
+        fut = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("BrowserPool 已關閉")
+            self._tasks.put((fut, fn, args))
+        return fut
+
+    def _run(self):
+        while True:
+            task = self._tasks.get()
+            if task is _CLOSE:
+                # 每條執行緒只會取到一個 _CLOSE，取到後在自己的執行緒上關閉瀏覽器
+                self._drop()
+                return
+            fut, fn, args = task
+            if not fut.set_running_or_notify_cancel():
+                continue
+            try:
+                fut.set_result(fn(*args))
+            except BaseException as e:
+                fut.set_exception(e)
+
+    def _worker(self) -> _Worker:
+        worker = getattr(self._local, "worker", None)
+        if worker is not None and not worker.browser.is_connected():
+            print("♻️ [BrowserPool] 瀏覽器已斷線，重新啟動")
+            self._drop()
+            worker = None
+        if worker is None:
+            worker = _Worker(self.headless, self.launch_args)
+            self._local.worker = worker
+            with self._lock:
+                self.launches += 1
+        return worker
+
+    def _drop(self):
+        worker = getattr(self._local, "worker", None)
+        self._local.worker = None
+        if worker is not None:
+            try:
+                worker.close()
+            except Exception:
+                pass
+
+    @contextmanager
+    def lease(self):
+        """借出目前執行緒的 page；離開 with 區塊時歸還 (或在超過使用次數 / 被 discard 時回收)。"""
+        worker = self._worker()
+        slot = worker.slot
+        worker.slot = None
+        if slot is not None and not slot.healthy():
+            slot.close()
+            slot = None
+        if slot is None:
+            slot = _Slot(worker.browser, self.viewport)
+        self._local.discard = False
+        ok = False
+        try:
+            yield slot.page
+            ok = True
+        finally:
+            slot.uses += 1
+            if ok and not self._local.discard and slot.healthy() and slot.uses < self.max_uses:
+                worker.slot = slot
+            else:
+                slot.close()
+                with self._lock:
+                    self.recycled += 1
+
+    def discard(self):
+        """標記目前借出的 page 狀態不明 (如導覽失敗)，歸還時直接關閉而不放回池中。"""
+        self._local.discard = True
+
+    def close(self, timeout: float = 10):
+        """通知每條執行緒關閉各自的瀏覽器並結束。"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        for _ in self._threads:
+            self._tasks.put(_CLOSE)
+        for t in self._threads:
+            t.join(timeout)
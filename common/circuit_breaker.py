@@ -0,0 +1,77 @@
+import functools
+import threading
+import time
+from typing import Callable, Optional
+
+
+class CircuitBreaker:
+    """行程內共用的熔斷器。
+
+    - closed：正常放行；連續失敗達 failure_threshold 次後轉為 open
+    - open：直接拒絕，reset_timeout 秒後轉為 half-open
+    - half-open：只放行一個試探請求，成功則恢復 closed，失敗則再次 open
+    guard() 包裝真正打後端的函數，只有實際送出的呼叫才會記錄成敗 (放在快取之下，快取命中不影響熔斷)。
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half-open"
+                self._probing = False
+            if self.state == "closed":
+                return True
+            if self.state == "half-open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def is_open(self) -> bool:
+        """熔斷中且尚未到試探時間；與 allow() 不同，不會佔用 half-open 的試探名額。"""
+        with self._lock:
+            return self.state == "open" and time.monotonic() - self._opened_at < self.reset_timeout
+
+    def guard(self, rejected, is_error: Optional[Callable] = None):
+        """裝飾器：熔斷時不呼叫後端、直接回傳 rejected；否則依結果 (例外或 is_error) 記錄成敗。"""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.allow():
+                    return rejected
+                try:
+                    result = fn(*args, **kwargs)
+                except Exception:
+                    self.record_failure()
+                    raise
+                if is_error is not None and is_error(result):
+                    self.record_failure()
+                else:
+                    self.record_success()
+                return result
+            return wrapper
+        return decorator
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self.state == "half-open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    print(f"🔌 [CircuitBreaker] {self.name} 熔斷開啟，{self.reset_timeout:.0f} 秒內直接改走備援")
+                self.state = "open"
+                self._opened_at = time.monotonic()
@@ -0,0 +1,113 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+# 所有腳本共用同一份快取 (repo 根目錄的 .cache/embeddings)，可用環境變數改位置
+DEFAULT_CACHE_DIR = os.environ.get(
+    "EMBED_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "embeddings"))
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def cache_namespace(endpoint: str, task_description: Optional[str] = None, normalize: bool = True) -> str:
+    """同一段文字在不同模型 / 任務描述 / 是否正規化下向量不同，需分開存。"""
+    return f"{endpoint}|{task_description or ''}|{int(bool(normalize))}"
+
+
+class EmbeddingCache:
+    """以內容雜湊為鍵的持久化 embedding 快取。
+
+    - 向量依維度存在 vectors_<dim>.f32 (float32，只追加)，讀取時以 memmap 取用
+    - index.sqlite 記錄 (namespace, 文字雜湊) → 所在列
+    寫入時先取得 SQLite 寫鎖再追加向量檔，多個腳本同時執行也不會錯列。
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_DIR):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.stats = {"hits": 0, "misses": 0}
+        self._maps = {}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(path, "index.sqlite"), check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS vectors (
+                namespace TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                row INTEGER NOT NULL,
+                PRIMARY KEY (namespace, text_hash)
+            )
+        """)
+
+    def _file(self, dim: int) -> str:
+        return os.path.join(self.path, f"vectors_{dim}.f32")
+
+    def _view(self, dim: int, min_rows: int) -> np.ndarray:
+        # 其他行程可能已追加新列；映射範圍不夠時重新 memmap
+        view = self._maps.get(dim)
+        if view is None or len(view) < min_rows:
+            rows = os.path.getsize(self._file(dim)) // (4 * dim)
+            view = np.memmap(self._file(dim), dtype=np.float32, mode="r", shape=(rows, dim))
+            self._maps[dim] = view
+        return view
+
+    def _lookup(self, namespace: str, hashes: List[str]) -> dict:
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        for start in range(0, len(unique), 500):
+            part = unique[start:start + 500]
+            found.update((h, (dim, row)) for h, dim, row in self._db.execute(
+                f"SELECT text_hash, dim, row FROM vectors WHERE namespace = ? AND text_hash IN "
+                f"({','.join('?' * len(part))})", (namespace, *part)))
+        return found
+
+    def get_many(self, namespace: str, texts: List[str]) -> List[Optional[List[float]]]:
+        hashes = [text_hash(t) for t in texts]
+        with self._lock:
+            found = self._lookup(namespace, hashes)
+            results = []
+            for h in hashes:
+                if h in found:
+                    dim, row = found[h]
+                    results.append(self._view(dim, row + 1)[row].tolist())
+                else:
+                    results.append(None)
+            hits = sum(r is not None for r in results)
+            self.stats["hits"] += hits
+            self.stats["misses"] += len(results) - hits
+        return results
+
+    def put_many(self, namespace: str, texts: List[str], vectors: List[List[float]]):
+        by_dim = {}
+        for text, vec in zip(texts, vectors):
+            by_dim.setdefault(len(vec), {})[text_hash(text)] = vec
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                for dim, items in by_dim.items():
+                    known = self._lookup(namespace, list(items))
+                    items = {h: v for h, v in items.items() if h not in known}
+                    if not items:
+                        continue
+                    with open(self._file(dim), "ab") as f:
+                        # 上次寫到一半中斷時，先截掉不完整的尾列
+                        size = f.seek(0, os.SEEK_END)
+                        if size % (4 * dim):
+                            size -= size % (4 * dim)
+                            f.truncate(size)
+                        first = size // (4 * dim)
+                        f.write(np.asarray(list(items.values()), dtype=np.float32).tobytes())
+                    self._db.executemany("INSERT INTO vectors VALUES (?, ?, ?, ?)",
+                                         [(namespace, h, dim, first + i) for i, h in enumerate(items)])
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
@@ -0,0 +1,130 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from common.embed_cache import EmbeddingCache, cache_namespace
+
+
+class EmbeddingError(Exception):
+    """部分文字在切半重試後仍無法取得向量。"""
+
+    def __init__(self, failed: List[int], message: str):
+        super().__init__(message)
+        self.failed = failed
+
+
+class EmbeddingClient:
+    """/embed 端點的批次用戶端。
+
+    - 依筆數 (max_batch) 與總字數 (max_chars) 切成小批次，workers 個批次同時在途
+    - 失敗的批次切成兩半各自重送，單筆仍失敗時以指數退避重試 max_retries 次
+    - 結果依原始順序組回，並在 stats 記錄吞吐量 (texts/sec)
+    - 給了 cache 時先查本地快取，只送出未命中的文字
+    """
+
+    def __init__(self, url: str, normalize: bool = True, task_description: Optional[str] = None,
+                 max_batch: int = 32, max_chars: int = 16000, workers: int = 4,
+                 timeout: float = 60, max_retries: int = 2, backoff_base: float = 0.5,
+                 cache: Optional[EmbeddingCache] = None):
+        self.url = url
+        self.normalize = normalize
+        self.task_description = task_description
+        self.max_batch = max_batch
+        self.max_chars = max_chars
+        self.workers = workers
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.cache = cache
+        self.namespace = cache_namespace(url, task_description, normalize)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed")
+        self.stats = {"texts": 0, "requests": 0, "bisects": 0, "retries": 0, "seconds": 0.0}
+
+    def _batches(self, indices: List[int], texts: List[str]) -> List[List[int]]:
+        batches, batch, chars = [], [], 0
+        for i in indices:
+            size = len(texts[i])
+            if batch and (len(batch) >= self.max_batch or chars + size > self.max_chars):
+                batches.append(batch)
+                batch, chars = [], 0
+            batch.append(i)
+            chars += size
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _post(self, texts: List[str]) -> List[List[float]]:
+        payload = {"texts": texts, "normalize": self.normalize, "batch_size": self.max_batch}
+        if self.task_description:
+            payload["task_description"] = self.task_description
+        response = self.session.post(self.url, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        vectors = response.json()["embeddings"]
+        if len(vectors) != len(texts):
+            raise ValueError(f"回傳 {len(vectors)} 個向量，預期 {len(texts)} 個")
+        return vectors
+
+    def _send(self, texts: List[str], attempt: int) -> List[List[float]]:
+        if attempt:
+            time.sleep(self.backoff_base * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+        return self._post(texts)
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """回傳與 texts 同順序的向量；有文字最終失敗時拋出 EmbeddingError。"""
+        if not texts:
+            return []
+        results: List[Optional[List[float]]] = (
+            self.cache.get_many(self.namespace, texts) if self.cache else [None] * len(texts))
+        indices = [i for i, vec in enumerate(results) if vec is None]
+        if not indices:
+            return results
+        t0 = time.perf_counter()
+        failed, last_error = [], None
+        pending = {self._executor.submit(self._send, [texts[i] for i in b], 0): (b, 0)
+                   for b in self._batches(indices, texts)}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                batch, attempt = pending.pop(fut)
+                self.stats["requests"] += 1
+                try:
+                    for i, vec in zip(batch, fut.result()):
+                        results[i] = vec
+                    continue
+                except Exception as e:
+                    last_error = e
+                if len(batch) > 1:
+                    # 整批失敗可能只是其中一筆過長或伺服器逾時：切半後各自重送
+                    self.stats["bisects"] += 1
+                    mid = len(batch) // 2
+                    for half in (batch[:mid], batch[mid:]):
+                        pending[self._executor.submit(self._send, [texts[i] for i in half], 0)] = (half, 0)
+                elif attempt < self.max_retries:
+                    self.stats["retries"] += 1
+                    pending[self._executor.submit(self._send, [texts[batch[0]]], attempt + 1)] = (batch, attempt + 1)
+                else:
+                    failed.extend(batch)
+
+        elapsed = time.perf_counter() - t0
+        if self.cache:
+            fetched = [i for i in indices if results[i] is not None]
+            self.cache.put_many(self.namespace, [texts[i] for i in fetched], [results[i] for i in fetched])
+        self.stats["texts"] += len(indices) - len(failed)
+        self.stats["seconds"] += elapsed
+        if len(indices) > self.max_batch:
+            print(f"⚡ Embedding {len(indices)} 筆，耗時 {elapsed:.2f}s "
+                  f"({len(indices) / max(elapsed, 1e-9):.1f} texts/s，{self.workers} 路並行)")
+        if failed:
+            raise EmbeddingError(sorted(failed), f"{len(failed)} 筆文字重試後仍失敗: {last_error}")
+        return results
+
+    def throughput(self) -> float:
+        return self.stats["texts"] / self.stats["seconds"] if self.stats["seconds"] else 0.0
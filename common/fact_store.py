@@ -0,0 +1,47 @@
+import re
+from difflib import SequenceMatcher
+from typing import List
+
+from common.tokens import estimate_tokens
+
+_BULLET = re.compile(r"^\s*(?:[-*•‧・]|\d+[.)、]|[（(]?\d+[）)])\s*")
+_NOISE = re.compile(r"[\s，,。.、；;：:！!？?「」『』\"'（）()\[\]【】*_#-]+")
+
+
+def parse_facts(text: str) -> List[str]:
+    """把 LLM 的條列式輸出拆成一行一條事實。"""
+    facts = []
+    for line in text.splitlines():
+        line = _BULLET.sub("", line).strip()
+        if len(line) > 4:
+            facts.append(line)
+    return facts
+
+
+def _norm(fact: str) -> str:
+    return _NOISE.sub("", fact).lower()
+
+
+def merge_facts(existing: List[str], new: List[str], similarity: float = 0.85) -> List[str]:
+    """將新事實併入既有清單，略過完全相同或高度相似的重複項。"""
+    merged = list(existing)
+    seen = [_norm(f) for f in merged]
+    for fact in new:
+        key = _norm(fact)
+        if not key or any(key == s or SequenceMatcher(None, key, s).ratio() >= similarity for s in seen):
+            continue
+        merged.append(fact)
+        seen.append(key)
+    return merged
+
+
+def render_facts(facts: List[str], token_budget: int) -> str:
+    """在 token 預算內輸出條列事實；超出時優先捨棄最早的事實 (保留後續補查的資訊)。"""
+    kept, used = [], 0
+    for fact in reversed(facts):
+        cost = estimate_tokens(fact) + 2
+        if used + cost > token_budget:
+            break
+        kept.append(fact)
+        used += cost
+    return "\n".join(f"- {f}" for f in reversed(kept))
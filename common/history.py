@@ -0,0 +1,69 @@
+from typing import List
+
+from langchain_core.messages import (
+    AIMessage, BaseMessage, HumanMessage, RemoveMessage, SystemMessage, ToolMessage
+)
+
+from common.tokens import estimate_tokens, truncate_tokens
+
+
+def _render(msg: BaseMessage) -> str:
+    if isinstance(msg, HumanMessage):
+        return f"使用者：{msg.content}"
+    if isinstance(msg, ToolMessage):
+        return f"工具結果：{msg.content}"
+    if isinstance(msg, AIMessage) and msg.tool_calls:
+        calls = ", ".join(f"{c['name']}({c['args']})" for c in msg.tool_calls)
+        return f"助理呼叫工具：{calls}"
+    return f"助理：{msg.content}"
+
+
+def messages_tokens(messages: List[BaseMessage]) -> int:
+    return sum(estimate_tokens(_render(m)) for m in messages)
+
+
+def with_summary(state: dict) -> List[BaseMessage]:
+    """送給 LLM 的訊息：有滾動摘要時放在最前面。"""
+    summary = state.get("summary")
+    if not summary:
+        return state["messages"]
+    return [SystemMessage(content=f"先前對話摘要：{summary}")] + state["messages"]
+
+
+def make_compaction_node(llm, keep_turns: int = 3, token_budget: int = 2000):
+    """建立壓縮節點：保留最近 keep_turns 輪原文，較舊的輪次併入滾動摘要。
+
+    以 HumanMessage 作為每輪的起點切割，因此 tool call 與其 ToolMessage
+    一定落在同一輪，不會被拆開。保留的原文超過 token_budget 時會再減少輪數
+    (至少保留目前這一輪)。摘要本身限 token_budget // 2 個 token，模型超出時直接截斷，
+    避免過長的摘要每輪被餵回並再次摘要而持續膨脹。
+    """
+    summary_budget = token_budget // 2
+
+    def compact(state: dict):
+        messages = state["messages"]
+        starts = [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+        if len(starts) <= 1:
+            return {}
+        keep = min(keep_turns, len(starts))
+        while keep > 1 and messages_tokens(messages[starts[-keep]:]) > token_budget:
+            keep -= 1
+        cut = starts[-keep]
+        old = messages[:cut]
+        if not old:
+            return {}
+
+        transcript = "\n".join(_render(m) for m in old)
+        prompt = (
+            f"以下是先前的對話摘要與更早的對話內容，請整合成一份新的摘要，"
+            f"保留使用者需求、已得到的結論與重要數據，限 {summary_budget} 字以內。\n\n"
+            f"先前摘要：{state.get('summary') or '無'}\n\n對話內容：\n{transcript}"
+        )
+        summary = llm.invoke(prompt).content.strip()
+        if estimate_tokens(summary) > summary_budget:
+            print(f"✂️ [Compaction] 摘要約 {estimate_tokens(summary)} tokens，超過上限 {summary_budget}，已截斷")
+            summary = truncate_tokens(summary, summary_budget)
+        print(f"🗜️ [Compaction] 將 {len(old)} 則舊訊息併入摘要，保留最近 {keep} 輪")
+        return {"summary": summary, "messages": [RemoveMessage(id=m.id) for m in old]}
+
+    return compact
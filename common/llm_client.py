@@ -0,0 +1,324 @@
+import asyncio
+import email.utils
+import os
+import random
+import threading
+import time
+from typing import Callable, List, Optional, Union
+
+import httpx
+from langchain_openai import ChatOpenAI
+
+# 每個端點的預設上限，可用環境變數整體調整
+DEFAULT_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "4"))
+DEFAULT_RATE = float(os.environ.get("LLM_RATE", "4"))          # 每秒請求數 (token bucket 補充速度)
+DEFAULT_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "120"))
+DEFAULT_MAX_RETRIES = 2                                        # 交給 openai SDK 處理 5xx / 逾時重試
+MAX_THROTTLE_RETRIES = 5                                       # 429 在傳輸層自行等待重送的次數上限
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 30.0
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After 可能是秒數或 HTTP 日期，皆轉成要等待的秒數。"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """單一端點的流量閘門：token bucket 限速 + 同時請求數上限 + 429 全域暫停。
+
+    同一端點的所有呼叫 (不論同步、非同步或來自哪個腳本實例) 共用一個閘門，
+    一旦收到 429，所有請求都會等到 Retry-After 之後才再送出。
+    """
+
+    def __init__(self, rate: float = DEFAULT_RATE, burst: Optional[int] = None,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY):
+        self.rate = rate
+        self.burst = burst or max(1, max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.stats = {"requests": 0, "throttled": 0, "retries": 0, "waited": 0.0}
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """嘗試取一個 token；成功回傳 0，否則回傳建議等待秒數。"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if now < self._paused_until:
+                return self._paused_until - now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self.stats["requests"] += 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def _add_wait(self, seconds: float):
+        with self._lock:
+            self.stats["waited"] += seconds
+
+    def acquire(self):
+        t0 = time.monotonic()
+        self._slots.acquire()
+        while (wait := self._reserve()) > 0:
+            time.sleep(wait)
+        self._add_wait(time.monotonic() - t0)
+
+    async def aacquire(self):
+        # threading 的 semaphore 不能 await；以短間隔輪詢，讓同步與非同步呼叫共用同一個上限
+        t0 = time.monotonic()
+        while not self._slots.acquire(blocking=False):
+            await asyncio.sleep(0.02)
+        while (wait := self._reserve()) > 0:
+            await asyncio.sleep(wait)
+        self._add_wait(time.monotonic() - t0)
+
+    def release(self):
+        self._slots.release()
+
+    def throttle(self, response: httpx.Response, attempt: int) -> float:
+        """收到 429：依 Retry-After (沒有時用指數退避) 暫停整個端點，回傳暫停秒數。"""
+        delay = parse_retry_after(response.headers.get("retry-after"))
+        if delay is None:
+            delay = min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self._tokens = 0.0
+            self.stats["throttled"] += 1
+        return delay
+
+
+_retry_listeners: List[Callable[[str], None]] = []
+
+
+def add_retry_listener(fn: Callable[[str], None]):
+    """註冊重試通知 fn(reason)，reason 為 "429" (傳輸層自行重送) 或 "sdk" (openai SDK 的 5xx / 逾時重試)。
+
+    在發出請求的執行緒 / task 中呼叫，因此可依 contextvars 歸屬到目前的節點。
+    """
+    _retry_listeners.append(fn)
+
+
+def _record_retry(limiter: RateLimiter, reason: str):
+    with limiter._lock:
+        limiter.stats["retries"] += 1
+    for fn in _retry_listeners:
+        fn(reason)
+
+
+def _is_sdk_retry(request: httpx.Request) -> bool:
+    # openai SDK 每次重試都會帶上已重試的次數
+    try:
+        return int(request.headers.get("x-stainless-retry-count", "0")) > 0
+    except ValueError:
+        return False
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    """回應內容讀完 (或關閉) 時才歸還同時請求數，串流回應也會被正確計入。"""
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._release()
+
+
+class _AsyncReleasingStream(httpx.AsyncByteStream):
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+
+def _once(fn):
+    done = threading.Event()
+
+    def wrapper():
+        if not done.is_set():
+            done.set()
+            fn()
+    return wrapper
+
+
+class _LimitedTransport(httpx.BaseTransport):
+    def __init__(self, limiter: RateLimiter, transport: httpx.BaseTransport):
+        self.limiter = limiter
+        self._transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if _is_sdk_retry(request):
+            _record_retry(self.limiter, "sdk")
+        for attempt in range(MAX_THROTTLE_RETRIES + 1):
+            self.limiter.acquire()
+            try:
+                response = self._transport.handle_request(request)
+            except BaseException:
+                self.limiter.release()
+                raise
+            if response.status_code == 429 and attempt < MAX_THROTTLE_RETRIES:
+                response.read()
+                response.close()
+                self.limiter.release()
+                time.sleep(self.limiter.throttle(response, attempt))
+                _record_retry(self.limiter, "429")
+                continue
+            return httpx.Response(response.status_code, headers=response.headers,
+                                  stream=_ReleasingStream(response.stream, _once(self.limiter.release)),
+                                  extensions=response.extensions)
+
+    def close(self):
+        self._transport.close()
+
+
+class _AsyncLimitedTransport(httpx.AsyncBaseTransport):
+    def __init__(self, limiter: RateLimiter, transport: httpx.AsyncBaseTransport):
+        self.limiter = limiter
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if _is_sdk_retry(request):
+            _record_retry(self.limiter, "sdk")
+        for attempt in range(MAX_THROTTLE_RETRIES + 1):
+            await self.limiter.aacquire()
+            try:
+                response = await self._transport.handle_async_request(request)
+            except BaseException:
+                self.limiter.release()
+                raise
+            if response.status_code == 429 and attempt < MAX_THROTTLE_RETRIES:
+                await response.aread()
+                await response.aclose()
+                self.limiter.release()
+                await asyncio.sleep(self.limiter.throttle(response, attempt))
+                _record_retry(self.limiter, "429")
+                continue
+            return httpx.Response(response.status_code, headers=response.headers,
+                                  stream=_AsyncReleasingStream(response.stream, _once(self.limiter.release)),
+                                  extensions=response.extensions)
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def _resolve_api_key(api_key: str) -> str:
+    # vLLM 不檢查金鑰，但 openai SDK 不接受空字串
+    return api_key or os.environ.get("OPENAI_API_KEY") or "EMPTY"
+
+
+class LLMEndpoint:
+    """一個 OpenAI 相容端點的共用連線：keep-alive 連線池 + 流量閘門。
+
+    - chat_model(model, ...)：回傳共用此連線池的 ChatOpenAI，供 LangChain / LangGraph 使用
+    - complete(...) / acomplete(...)：不經 LangChain 的同步 / 非同步 chat completions 呼叫
+    """
+
+    def __init__(self, base_url: str, api_key: str = "", rate: float = DEFAULT_RATE,
+                 burst: Optional[int] = None, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 timeout: float = DEFAULT_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = _resolve_api_key(api_key)
+        self.timeout = timeout
+        self.settings = {"rate": rate, "burst": burst, "max_concurrency": max_concurrency, "timeout": timeout}
+        self.limiter = RateLimiter(rate=rate, burst=burst, max_concurrency=max_concurrency)
+        self._limits = httpx.Limits(max_connections=max_concurrency,
+                                    max_keepalive_connections=max_concurrency, keepalive_expiry=60)
+        self.http_client = httpx.Client(
+            transport=_LimitedTransport(self.limiter, httpx.HTTPTransport(limits=self._limits)),
+            timeout=timeout)
+        # AsyncClient 在第一次使用時才綁定 event loop，同一行程內請只在一個 loop 中使用
+        self.http_async_client = httpx.AsyncClient(
+            transport=_AsyncLimitedTransport(self.limiter, httpx.AsyncHTTPTransport(limits=self._limits)),
+            timeout=timeout)
+
+    def chat_model(self, model: str, temperature: float = 0, timeout: Optional[float] = None,
+                   max_retries: int = DEFAULT_MAX_RETRIES, **kwargs) -> ChatOpenAI:
+        return ChatOpenAI(
+            base_url=self.base_url,
+            api_key=self.api_key,
+            model=model,
+            temperature=temperature,
+            timeout=timeout or self.timeout,
+            max_retries=max_retries,
+            http_client=self.http_client,
+            http_async_client=self.http_async_client,
+            **kwargs,
+        )
+
+    def _payload(self, prompt: Union[str, List[dict]], model: str, params: dict) -> dict:
+        messages = [{"role": "user", "content": prompt}] if isinstance(prompt, str) else prompt
+        return {"model": model, "messages": messages, **params}
+
+    def complete(self, prompt: Union[str, List[dict]], model: str, timeout: Optional[float] = None,
+                 **params) -> str:
+        response = self.http_client.post(f"{self.base_url}/chat/completions",
+                                         json=self._payload(prompt, model, params),
+                                         headers={"Authorization": f"Bearer {self.api_key}"},
+                                         timeout=timeout or self.timeout)
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    async def acomplete(self, prompt: Union[str, List[dict]], model: str, timeout: Optional[float] = None,
+                        **params) -> str:
+        response = await self.http_async_client.post(f"{self.base_url}/chat/completions",
+                                                     json=self._payload(prompt, model, params),
+                                                     headers={"Authorization": f"Bearer {self.api_key}"},
+                                                     timeout=timeout or self.timeout)
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+
+_endpoints = {}
+_endpoints_lock = threading.Lock()
+
+
+def get_endpoint(base_url: str, api_key: str = "", **kwargs) -> LLMEndpoint:
+    """同一組 base_url + api_key 在整個行程內只建一次，連線池與限流也因此共用。
+
+    之後的呼叫若給了不同的限流 / timeout 設定，沿用第一次建立時的設定並印出警告；
+    個別模型的 timeout 請改傳給 chat_model(..., timeout=...) 或 complete(..., timeout=...)。
+    """
+    url = base_url.rstrip("/")
+    key = (url, _resolve_api_key(api_key))
+    with _endpoints_lock:
+        endpoint = _endpoints.get(key)
+        if endpoint is None:
+            return _endpoints.setdefault(key, LLMEndpoint(url, api_key, **kwargs))
+    conflicts = {k: v for k, v in kwargs.items() if endpoint.settings.get(k) != v}
+    if conflicts:
+        print(f"⚠️ [LLM] {url} 已以 {endpoint.settings} 建立，忽略新的設定 {conflicts}")
+    return endpoint
+
+
+def chat_model(base_url: str, model: str, api_key: str = "", **kwargs) -> ChatOpenAI:
+    """取代各腳本自行建立的 ChatOpenAI：chat_model(url, model, temperature=0, callbacks=[...])"""
+    return get_endpoint(base_url, api_key).chat_model(model, **kwargs)
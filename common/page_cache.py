@@ -0,0 +1,109 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+
+def content_hash(data) -> str:
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+class PageCache:
+    """以 (URL, 頁面內容雜湊) 為鍵的網頁分析快取 (SQLite)。
+
+    - summaries：與問題無關的頁面摘要，可被不同問題共用
+    - analyses：針對特定問題的分析結果
+    頁面內容不變時即可跳過 VLM；總容量超過 max_bytes 時以 LRU 淘汰。
+    """
+
+    def __init__(self, path: str, max_bytes: int = 50 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.stats = {"analysis_hit": 0, "summary_hit": 0, "miss": 0}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS summaries (
+                url TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (url, content_hash)
+            );
+            CREATE TABLE IF NOT EXISTS analyses (
+                url TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                question_hash TEXT NOT NULL,
+                analysis TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (url, content_hash, question_hash)
+            );
+        """)
+        self._db.commit()
+
+    def get_analysis(self, url: str, page_hash: str, question: str) -> Optional[str]:
+        key = (url, page_hash, content_hash(question))
+        with self._lock:
+            row = self._db.execute(
+                "SELECT analysis FROM analyses WHERE url = ? AND content_hash = ? AND question_hash = ?", key
+            ).fetchone()
+            if row:
+                self._db.execute(
+                    "UPDATE analyses SET last_used = ? WHERE url = ? AND content_hash = ? AND question_hash = ?",
+                    (time.time(), *key))
+                self._db.commit()
+                self.stats["analysis_hit"] += 1
+                return row[0]
+        return None
+
+    def get_summary(self, url: str, page_hash: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT summary FROM summaries WHERE url = ? AND content_hash = ?", (url, page_hash)
+            ).fetchone()
+            if row:
+                self._db.execute("UPDATE summaries SET last_used = ? WHERE url = ? AND content_hash = ?",
+                                 (time.time(), url, page_hash))
+                self._db.commit()
+                self.stats["summary_hit"] += 1
+                return row[0]
+            self.stats["miss"] += 1
+        return None
+
+    def put_summary(self, url: str, page_hash: str, summary: str):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?, ?)",
+                             (url, page_hash, summary, len(summary.encode("utf-8")), time.time()))
+            self._evict()
+
+    def put_analysis(self, url: str, page_hash: str, question: str, analysis: str):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO analyses VALUES (?, ?, ?, ?, ?, ?)",
+                             (url, page_hash, content_hash(question), analysis,
+                              len(analysis.encode("utf-8")), time.time()))
+            self._evict()
+
+    def _evict(self):
+        total = sum(self._db.execute(f"SELECT COALESCE(SUM(size), 0) FROM {t}").fetchone()[0]
+                    for t in ("summaries", "analyses"))
+        while total > self.max_bytes:
+            # 兩張表一起看，刪掉最久未使用的一筆
+            oldest = self._db.execute("""
+                SELECT 'summaries', rowid, size, last_used FROM summaries
+                UNION ALL
+                SELECT 'analyses', rowid, size, last_used FROM analyses
+                ORDER BY last_used LIMIT 1
+            """).fetchone()
+            if oldest is None:
+                break
+            self._db.execute(f"DELETE FROM {oldest[0]} WHERE rowid = ?", (oldest[1],))
+            total -= oldest[2]
+        self._db.commit()
+
+    def hit_rate(self) -> float:
+        total = sum(self.stats.values())
+        return (self.stats["analysis_hit"] + self.stats["summary_hit"]) / total if total else 0.0
@@ -0,0 +1,193 @@
+import queue
+import threading
+import time
+from typing import Callable, Iterable, List, Optional
+
+_DONE = object()
+
+
+class _Stage:
+    def __init__(self, name: str, fn: Callable, workers: int, batch_size: int, batch_timeout: float):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.stats = {"in": 0, "out": 0, "busy": 0.0, "blocked": 0.0}
+        self.lock = threading.Lock()
+        self.remaining = workers
+
+
+class Pipeline:
+    """以有界佇列串接的分段串流管線，例如 讀檔 → 切塊 → embedding → 上傳。
+
+    - 每段各有 workers 條執行緒，段與段之間是容量 queue_size 的佇列；
+      下游忙不過來時上游 put 會被擋住 (背壓)，記憶體用量與語料大小無關
+    - fn 接收一個項目 (batch_size > 1 時為一個 list)，回傳 0 到多個輸出項目 (可為 generator)
+    - 每 report_every 秒印出各段進度；結束時印出各段的處理量、忙碌 / 被擋時間與吞吐量
+    任一段拋出例外時整條管線停止，並在 run() 中重新拋出。
+    """
+
+    def __init__(self, name: str, queue_size: int = 8, report_every: float = 5.0):
+        self.name = name
+        self.queue_size = queue_size
+        self.report_every = report_every
+        self._stages: List[_Stage] = []
+        self._stop = threading.Event()
+        self._errors = []
+
+    def stage(self, name: str, fn: Callable, workers: int = 1, batch_size: int = 1,
+              batch_timeout: float = 0.5) -> "Pipeline":
+        self._stages.append(_Stage(name, fn, workers, batch_size, batch_timeout))
+        return self
+
+    def _put(self, stage: _Stage, q: Optional[queue.Queue], item) -> float:
+        """送往下游佇列，回傳被擋住的秒數。"""
+        with stage.lock:
+            stage.stats["out"] += 1
+        if q is None:
+            return 0.0
+        t0 = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        blocked = time.perf_counter() - t0
+        with stage.lock:
+            stage.stats["blocked"] += blocked
+        return blocked
+
+    def _get(self, q: queue.Queue, timeout: Optional[float] = None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._stop.is_set():
+            wait = 0.1 if deadline is None else min(0.1, deadline - time.monotonic())
+            if wait <= 0:
+                raise queue.Empty
+            try:
+                return q.get(timeout=wait)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _take(self, stage: _Stage, q: queue.Queue):
+        """取一個項目或湊一批；回傳 (項目 / 批次, 上游是否已結束)。"""
+        first = self._get(q)
+        if first is _DONE:
+            return None, True
+        if stage.batch_size == 1:
+            return first, False
+        batch = [first]
+        while len(batch) < stage.batch_size:
+            try:
+                item = self._get(q, stage.batch_timeout)
+            except queue.Empty:
+                break
+            if item is _DONE:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _worker(self, stage: _Stage, inq: queue.Queue, outq: Optional[queue.Queue], next_workers: int):
+        try:
+            done = False
+            while not done and not self._stop.is_set():
+                item, done = self._take(stage, inq)
+                if item is None:
+                    break
+                with stage.lock:
+                    stage.stats["in"] += len(item) if stage.batch_size > 1 else 1
+                t0 = time.perf_counter()
+                blocked = 0.0
+                for out in stage.fn(item) or ():
+                    blocked += self._put(stage, outq, out)
+                with stage.lock:
+                    # 忙碌時間不含被下游擋住的時間
+                    stage.stats["busy"] += time.perf_counter() - t0 - blocked
+        except BaseException as e:
+            self._errors.append((stage.name, e))
+            self._stop.set()
+        finally:
+            with stage.lock:
+                stage.remaining -= 1
+                last = stage.remaining == 0
+            if last and outq is not None:
+                for _ in range(next_workers):
+                    self._put_done(outq)
+
+    def _put_done(self, q: queue.Queue):
+        while not self._stop.is_set():
+            try:
+                q.put(_DONE, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _feed(self, source: Iterable, q: queue.Queue, stats: dict, next_workers: int):
+        try:
+            for item in source:
+                if self._stop.is_set():
+                    break
+                stats["in"] += 1
+                t0 = time.perf_counter()
+                while not self._stop.is_set():
+                    try:
+                        q.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                stats["blocked"] += time.perf_counter() - t0
+        except BaseException as e:
+            self._errors.append(("source", e))
+            self._stop.set()
+        finally:
+            for _ in range(next_workers):
+                self._put_done(q)
+
+    def run(self, source: Iterable) -> dict:
+        if not self._stages:
+            raise ValueError("Pipeline 至少需要一段 stage")
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self._stages]
+        source_stats = {"in": 0, "blocked": 0.0}
+        threads = [threading.Thread(target=self._feed, name=f"{self.name}-source",
+                                    args=(source, queues[0], source_stats, self._stages[0].workers), daemon=True)]
+        for i, stage in enumerate(self._stages):
+            outq = queues[i + 1] if i + 1 < len(self._stages) else None
+            next_workers = self._stages[i + 1].workers if outq is not None else 0
+            threads += [threading.Thread(target=self._worker, name=f"{self.name}-{stage.name}-{w}",
+                                         args=(stage, queues[i], outq, next_workers), daemon=True)
+                        for w in range(stage.workers)]
+
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            while t.is_alive():
+                t.join(self.report_every)
+                if t.is_alive():
+                    self._report_progress(source_stats, time.perf_counter() - t0)
+        wall = time.perf_counter() - t0
+        if self._errors:
+            name, error = self._errors[0]
+            print(f"❌ [{self.name}] {name} 階段失敗: {error!r}")
+            raise error
+        return self._print_summary(source_stats, wall)
+
+    def _report_progress(self, source_stats: dict, elapsed: float):
+        parts = [f"來源 {source_stats['in']}"] + [f"{s.name} {s.stats['out']}" for s in self._stages]
+        print(f"⏳ [{self.name}] {' → '.join(parts)} ({elapsed:.1f}s)")
+
+    def _print_summary(self, source_stats: dict, wall: float) -> dict:
+        print("\n" + "=" * 20 + f" 📦 {self.name} 管線統計 " + "=" * 20)
+        print(f"{'階段':<12}{'執行緒':>6}{'輸入':>9}{'輸出':>9}{'忙碌(s)':>10}{'被擋(s)':>10}{'處理/秒':>10}")
+        print(f"{'來源':<12}{1:>6}{'':>9}{source_stats['in']:>9}{'':>10}{source_stats['blocked']:>10.2f}"
+              f"{source_stats['in'] / max(wall, 1e-9):>10.1f}")
+        summary = {"wall": wall, "source": dict(source_stats)}
+        for s in self._stages:
+            st = s.stats
+            print(f"{s.name:<12}{s.workers:>6}{st['in']:>9}{st['out']:>9}{st['busy']:>10.2f}{st['blocked']:>10.2f}"
+                  f"{st['in'] / max(wall, 1e-9):>10.1f}")
+            summary[s.name] = dict(st)
+        print(f"總耗時: {wall:.2f}s")
+        return summary
@@ -0,0 +1,72 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query.replace('"', "").replace("'", "")).strip().lower()
+
+
+class SearxngClient:
+    """SearXNG 搜尋用戶端：共用連線池的 Session + TTL 結果快取 + 批次查詢。"""
+
+    def __init__(self, url: str, ttl: float = 3600, max_entries: int = 1000,
+                 pool_size: int = 8, timeout: float = 10):
+        self.url = url
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="searxng")
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def search(self, query: str, limit: int = 2, language: str = "zh-TW") -> List[dict]:
+        key = (normalize_query(query), language)
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry and now - entry[0] < self.ttl:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return entry[1][:limit]
+            self.misses += 1
+
+        params = {"q": query, "format": "json", "language": language}
+        try:
+            response = self.session.get(self.url, params=params, timeout=self.timeout)
+            response.raise_for_status()
+            results = [r for r in response.json().get('results', []) if 'url' in r]
+        except Exception as e:
+            print(f"❌ 搜尋出錯: {e}")
+            return []
+
+        with self._lock:
+            self._cache[key] = (now, results)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return results[:limit]
+
+    def search_many(self, queries: List[str], limit: int = 2, max_results: int = 4,
+                    language: str = "zh-TW") -> List[dict]:
+        """同時查詢多個關鍵字，輪流取各查詢的結果並依 URL 去重。"""
+        batches = list(self._executor.map(lambda q: self.search(q, limit, language), queries))
+        merged, seen = [], set()
+        for rank in range(limit):
+            for batch in batches:
+                if rank < len(batch) and batch[rank]['url'] not in seen:
+                    seen.add(batch[rank]['url'])
+                    merged.append(batch[rank])
+        return merged[:max_results]
@@ -0,0 +1,87 @@
+import re
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+# 句末標點後可能緊跟引號或括號，一起留在同一句
+SENTENCE_RE = re.compile(r"[^。！？!?\n]+(?:[。！？!?]+[」』”’）)]*)?")
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in SENTENCE_RE.findall(text) if s.strip()]
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class SemanticSplitter:
+    """以句向量找語義斷點的切塊器 (取代 langchain_experimental 的 SemanticChunker)。
+
+    - 每句只 embed 一次 (embed_fn 可接快取)，前後 buffer_size 句的視窗向量由句向量相加而得
+    - 相鄰視窗的 cosine 距離以 NumPy 一次算完，超過 percentile 分位數處即為斷點
+    - 同一段落內依句子邊界裝箱，每塊不超過 max_chars 字
+    - split_with_vectors() 另以句向量的字數加權平均當作 chunk 向量，可省掉第二次 embedding
+    """
+
+    def __init__(self, embed_fn: Callable[[List[str]], List[List[float]]], percentile: float = 95,
+                 buffer_size: int = 1, max_chars: int = 300):
+        self.embed_fn = embed_fn
+        self.percentile = percentile
+        self.buffer_size = buffer_size
+        self.max_chars = max_chars
+
+    def breakpoints(self, vectors: np.ndarray) -> np.ndarray:
+        """回傳斷點位置 i (在第 i 句之後切開)。"""
+        n = len(vectors)
+        if n < 2:
+            return np.array([], dtype=int)
+        unit = _normalize(vectors)
+        # 前綴和求每句前後 buffer_size 句的視窗向量
+        prefix = np.vstack([np.zeros((1, unit.shape[1]), dtype=unit.dtype), np.cumsum(unit, axis=0)])
+        idx = np.arange(n)
+        windows = _normalize(prefix[np.minimum(n, idx + self.buffer_size + 1)] - prefix[np.maximum(0, idx - self.buffer_size)])
+        distances = 1 - np.einsum("ij,ij->i", windows[:-1], windows[1:])
+        return np.flatnonzero(distances > np.percentile(distances, self.percentile))
+
+    def _pack(self, sentences: List[str], start: int, end: int) -> List[Tuple[str, List[int]]]:
+        """把 [start, end) 的句子依序裝箱；超長單句直接按字數硬切。"""
+        chunks, text, members = [], "", []
+        for i in range(start, end):
+            sentence = sentences[i]
+            if len(sentence) > self.max_chars:
+                if text:
+                    chunks.append((text, members))
+                    text, members = "", []
+                chunks.extend((sentence[j:j + self.max_chars], [i]) for j in range(0, len(sentence), self.max_chars))
+                continue
+            if text and len(text) + len(sentence) > self.max_chars:
+                chunks.append((text, members))
+                text, members = "", []
+            text += sentence
+            members.append(i)
+        if text:
+            chunks.append((text, members))
+        return chunks
+
+    def _split(self, text: str):
+        sentences = split_sentences(text)
+        if not sentences:
+            return [], sentences, None
+        vectors = np.asarray(self.embed_fn(sentences), dtype=np.float32)
+        bounds = [0, *(self.breakpoints(vectors) + 1).tolist(), len(sentences)]
+        chunks = [c for start, end in zip(bounds, bounds[1:]) for c in self._pack(sentences, start, end)]
+        return chunks, sentences, vectors
+
+    def split(self, text: str) -> List[str]:
+        return [chunk for chunk, _ in self._split(text)[0]]
+
+    def split_with_vectors(self, text: str) -> Tuple[List[str], List[List[float]]]:
+        chunks, sentences, vectors = self._split(text)
+        if not chunks:
+            return [], []
+        lengths = np.array([len(s) for s in sentences], dtype=np.float32)
+        unit = _normalize(vectors)
+        pooled = np.stack([(unit[members] * lengths[members, None]).sum(axis=0) for _, members in chunks])
+        return [chunk for chunk, _ in chunks], _normalize(pooled).tolist()
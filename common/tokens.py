@@ -0,0 +1,14 @@
+def estimate_tokens(text: str) -> int:
+    """粗估 token 數：中日韓字元約 1 字 1 token，其餘約 4 字元 1 token。"""
+    cjk = sum(1 for ch in text if '\u3000' <= ch <= '\u9fff' or '\uff00' <= ch <= '\uffef')
+    return cjk + (len(text) - cjk) // 4
+
+
+def truncate_tokens(text: str, budget: int) -> str:
+    """依 estimate_tokens 的算法截斷到 budget 個 token 以內。"""
+    used = 0.0
+    for i, ch in enumerate(text):
+        used += 1 if '\u3000' <= ch <= '\u9fff' or '\uff00' <= ch <= '\uffef' else 0.25
+        if used > budget:
+            return text[:i]
+    return text
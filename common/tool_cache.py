@@ -0,0 +1,115 @@
+import functools
+import inspect
+import threading
+import time
+from typing import Callable, Optional
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ToolResultCache:
+    """工具結果的 TTL 快取，可包裝任何函數 (放在 @tool 之下)。
+
+    - 相同 key 的並行呼叫只會打一次後端 (single-flight)，其餘等待共用結果
+    - 後端失敗 (拋例外或 is_error 判定為錯誤) 時，若有舊的成功結果則回傳舊值
+    - 錯誤結果不進快取；stats 提供命中率等統計
+    """
+
+    def __init__(self, ttl: float = 300, max_stale: float = 3600, max_entries: int = 1024,
+                 key_fn: Optional[Callable] = None, is_error: Optional[Callable] = None):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.max_entries = max_entries
+        self.key_fn = key_fn
+        self.is_error = is_error or (lambda result: False)
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "stale": 0, "errors": 0}
+        self._entries = {}
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, fn):
+        return self.wrap(fn)
+
+    def _key(self, sig, args, kwargs):
+        if self.key_fn:
+            return self.key_fn(*args, **kwargs)
+        bound = sig.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return tuple(sorted((k, repr(v)) for k, v in bound.arguments.items()))
+
+    def wrap(self, fn):
+        sig = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = self._key(sig, args, kwargs)
+            now = time.time()
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry and now - entry[1] < self.ttl:
+                    self.stats["hits"] += 1
+                    return entry[0]
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+                    self.stats["misses"] += 1
+                else:
+                    self.stats["coalesced"] += 1
+
+            if not leader:
+                flight.done.wait()
+                if flight.error is not None:
+                    raise flight.error
+                return flight.result
+
+            try:
+                flight.result = self._call(fn, key, entry, args, kwargs)
+            except Exception as e:
+                flight.error = e
+                raise
+            finally:
+                with self._lock:
+                    self._flights.pop(key, None)
+                flight.done.set()
+            return flight.result
+
+        wrapper.cache = self
+        return wrapper
+
+    def _call(self, fn, key, entry, args, kwargs):
+        try:
+            result = fn(*args, **kwargs)
+            failed = self.is_error(result)
+        except Exception:
+            result, failed = None, True
+            if not self._usable_stale(entry):
+                with self._lock:
+                    self.stats["errors"] += 1
+                raise
+
+        with self._lock:
+            if not failed:
+                self._entries[key] = (result, time.time())
+                if len(self._entries) > self.max_entries:
+                    # 淘汰最舊的一筆
+                    oldest = min(self._entries, key=lambda k: self._entries[k][1])
+                    del self._entries[oldest]
+                return result
+            self.stats["errors"] += 1
+            if self._usable_stale(entry):
+                self.stats["stale"] += 1
+                return entry[0]
+        return result
+
+    def _usable_stale(self, entry) -> bool:
+        return entry is not None and time.time() - entry[1] < self.max_stale
+
+    def hit_rate(self) -> float:
+        total = self.stats["hits"] + self.stats["misses"] + self.stats["coalesced"]
+        return (self.stats["hits"] + self.stats["coalesced"]) / total if total else 0.0
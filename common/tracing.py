@@ -0,0 +1,200 @@
+import contextvars
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables import RunnableConfig
+
+from common.llm_client import add_retry_listener
+
+# 每百萬 token 的價格 (美元)：{模型: (輸入, 輸出)}。課程端點為自架 vLLM，預設不計費；
+# 改用付費 API 時以環境變數 LLM_PRICES='{"模型": [輸入, 輸出]}' 覆寫或補充
+MODEL_PRICES = {
+    "google/gemma-3-27b-it": (0.0, 0.0),
+}
+MODEL_PRICES.update({k: tuple(v) for k, v in json.loads(os.environ.get("LLM_PRICES", "{}")).items()})
+
+
+def llm_cost(model: Optional[str], prompt_tokens: int, completion_tokens: int) -> float:
+    price_in, price_out = MODEL_PRICES.get(model or "", (0.0, 0.0))
+    return (prompt_tokens * price_in + completion_tokens * price_out) / 1e6
+
+
+_run_id = contextvars.ContextVar("trace_run_id", default=None)
+_node = contextvars.ContextVar("trace_node", default=None)
+
+
+def _new_stats():
+    return {"calls": 0, "wall": 0.0, "llm_calls": 0, "llm_wall": 0.0, "prompt_tokens": 0,
+            "completion_tokens": 0, "cost": 0.0, "retries": 0, "errors": 0, "cache_hits": 0}
+
+
+class _LLMCallback(BaseCallbackHandler):
+    """記錄每次 LLM 呼叫的耗時與 token 用量，並歸到目前所在的節點。"""
+
+    def __init__(self, tracer: "Tracer"):
+        self.tracer = tracer
+        self._starts = {}
+
+    def _start(self, run_id, metadata, kwargs):
+        metadata = metadata or {}
+        node = metadata.get("langgraph_node") or _node.get()
+        params = kwargs.get("invocation_params") or {}
+        model = metadata.get("ls_model_name") or params.get("model") or params.get("model_name")
+        self._starts[run_id] = (time.perf_counter(), node, model)
+
+    def _pop(self, run_id):
+        return self._starts.pop(run_id, (time.perf_counter(), _node.get(), None))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self._start(run_id, metadata, kwargs)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        self._start(run_id, metadata, kwargs)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        t0, node, model = self._pop(run_id)
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt, completion = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+        if not usage and response.generations and response.generations[0]:
+            # 串流模式沒有 llm_output，改從訊息的 usage_metadata 取得
+            meta = getattr(getattr(response.generations[0][0], "message", None), "usage_metadata", None) or {}
+            prompt, completion = meta.get("input_tokens", 0), meta.get("output_tokens", 0)
+        self.tracer._record_llm(node, model, time.perf_counter() - t0, prompt or 0, completion or 0, error=None)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        t0, node, model = self._pop(run_id)
+        self.tracer._record_llm(node, model, time.perf_counter() - t0, 0, 0, error=repr(error))
+
+
+class Tracer:
+    """LangGraph 應用的節點 / LLM 追蹤器。
+
+    - wrap(name, fn) 包裝節點，記錄耗時與錯誤
+    - callback 掛到 ChatOpenAI(callbacks=[...]) 以記錄 LLM 耗時、token 與依 MODEL_PRICES 換算的成本
+    - LLM 重試 (429、5xx、逾時) 由 llm_client 的傳輸層通知，計入目前節點
+    - 每筆事件寫入 JSONL，run() 結束時印出摘要表；run() 之外的事件只寫 JSONL、不計入統計
+    """
+
+    def __init__(self, app_name: str, trace_path: Optional[str] = None):
+        self.app_name = app_name
+        self.trace_path = trace_path
+        self.callback = _LLMCallback(self)
+        self._lock = threading.Lock()
+        self._runs = {}
+        add_retry_listener(self._on_retry)
+        if trace_path:
+            os.makedirs(os.path.dirname(os.path.abspath(trace_path)), exist_ok=True)
+
+    def _write(self, record: dict):
+        if not self.trace_path:
+            return
+        record = {"ts": time.time(), "app": self.app_name, "run_id": _run_id.get(), **record}
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            with open(self.trace_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def _stats(self, node: Optional[str]) -> Optional[dict]:
+        """目前執行中該節點的統計；不在 run() 之內時回傳 None (只寫 JSONL、不累計，避免無人釋放的統計堆積)。"""
+        run = self._runs.get(_run_id.get())
+        if run is None:
+            return None
+        return run.setdefault(node or "(outside)", _new_stats())
+
+    def _record_llm(self, node, model, wall, prompt_tokens, completion_tokens, error):
+        cost = llm_cost(model, prompt_tokens, completion_tokens)
+        with self._lock:
+            stats = self._stats(node)
+            if stats is not None:
+                stats["llm_calls"] += 1
+                stats["llm_wall"] += wall
+                stats["prompt_tokens"] += prompt_tokens
+                stats["completion_tokens"] += completion_tokens
+                stats["cost"] += cost
+                stats["errors"] += 1 if error else 0
+        self._write({"type": "llm", "node": node, "model": model, "wall": round(wall, 4),
+                     "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                     "cost": round(cost, 6), "error": error})
+
+    def count(self, field: str, n: int = 1, node: Optional[str] = None):
+        """在目前 (或指定) 節點累加計數，例如 cache_hits、retries。"""
+        node = node or _node.get()
+        with self._lock:
+            stats = self._stats(node)
+            if stats is not None:
+                stats[field] += n
+        self._write({"type": "count", "node": node, "field": field, "n": n})
+
+    def _on_retry(self, reason: str):
+        # 只計入本追蹤器正在進行的執行
+        if _run_id.get() in self._runs:
+            self.count("retries")
+
+    def wrap(self, name: str, fn):
+        """包裝節點函數 (或 Runnable，例如 ToolNode)。"""
+        is_runnable = hasattr(fn, "invoke")
+        wants_config = not is_runnable and "config" in inspect.signature(fn).parameters
+
+        def node(state, config: RunnableConfig):
+            token = _node.set(name)
+            t0 = time.perf_counter()
+            error = None
+            try:
+                if is_runnable:
+                    return fn.invoke(state, config)
+                return fn(state, config) if wants_config else fn(state)
+            except Exception as e:
+                error = repr(e)
+                raise
+            finally:
+                wall = time.perf_counter() - t0
+                with self._lock:
+                    stats = self._stats(name)
+                    if stats is not None:
+                        stats["calls"] += 1
+                        stats["wall"] += wall
+                        stats["errors"] += 1 if error else 0
+                self._write({"type": "node", "node": name, "wall": round(wall, 4), "error": error})
+                _node.reset(token)
+
+        node.__name__ = name
+        return node
+
+    @contextmanager
+    def run(self, label: str = "", summary: bool = True):
+        """標記一次完整執行 (一個問題)；結束時寫入 run 紀錄並印出摘要。"""
+        token = _run_id.set(uuid.uuid4().hex[:12])
+        with self._lock:
+            self._runs[_run_id.get()] = {}
+        t0 = time.perf_counter()
+        self._write({"type": "run_start", "label": label})
+        try:
+            yield _run_id.get()
+        finally:
+            wall = time.perf_counter() - t0
+            self._write({"type": "run_end", "label": label, "wall": round(wall, 4)})
+            if summary:
+                self.print_summary(wall)
+            with self._lock:
+                self._runs.pop(_run_id.get(), None)
+            _run_id.reset(token)
+
+    def print_summary(self, total_wall: Optional[float] = None):
+        with self._lock:
+            run = dict(self._runs.get(_run_id.get(), {}))
+        print("\n" + "=" * 24 + f" ⏱️ {self.app_name} 執行統計 " + "=" * 24)
+        print(f"{'節點':<18}{'次數':>5}{'耗時(s)':>10}{'LLM次數':>8}{'LLM(s)':>9}"
+              f"{'輸入tok':>9}{'輸出tok':>9}{'成本($)':>10}{'重試':>5}{'錯誤':>5}{'快取':>5}")
+        for node, s in run.items():
+            print(f"{node:<18}{s['calls']:>5}{s['wall']:>10.2f}{s['llm_calls']:>8}{s['llm_wall']:>9.2f}"
+                  f"{s['prompt_tokens']:>9}{s['completion_tokens']:>9}{s['cost']:>10.4f}"
+                  f"{s['retries']:>5}{s['errors']:>5}{s['cache_hits']:>5}")
+        if total_wall is not None:
+            print(f"總耗時: {total_wall:.2f}s")
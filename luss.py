@@ -1,23 +1,62 @@
 import random
 import json
 import os
+import time
 from typing import Annotated, TypedDict, Union, Literal
-from langchain_openai import ChatOpenAI
 from langchain_core.tools import tool
 from langchain_core.messages import SystemMessage, HumanMessage, BaseMessage, ToolMessage, AIMessage
 from langgraph.graph import StateGraph, END, add_messages
+from langchain_core.runnables import RunnableConfig
 from langgraph.prebuilt import ToolNode
+from langgraph.checkpoint.memory import MemorySaver
+from common.tracing import Tracer
+from common.llm_client import chat_model
+from common.circuit_breaker import CircuitBreaker
+from common.tool_cache import ToolResultCache
+from common.history import make_compaction_node, with_summary
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# 節點 / LLM 耗時與 token 追蹤
+tracer = Tracer("luss", os.path.join(BASE_DIR, "out", "luss_trace.jsonl"))
 
 # ================= 配置區 =================
-llm = ChatOpenAI(
-    base_url="https://ws-02.wade0426.me/v1",  #
+MAX_RETRIES = 3          # 單一對話內連續失敗的重試上限
+BACKOFF_BASE = 0.5       # 指數退避的基準秒數
+BACKOFF_CAP = 8.0        # 單次退避的最長秒數
+KEEP_TURNS = 3           # 對話歷史保留最近幾輪原文
+HISTORY_TOKEN_BUDGET = 2000  # 保留原文的 token 上限，超過的舊輪次併入摘要
+
+# 所有對話共用的熔斷器：後端確定掛掉時，新對話不再浪費 LLM + 工具往返
+weather_breaker = CircuitBreaker("get_weather", failure_threshold=5, reset_timeout=30)
+
+llm = chat_model(
+    "https://ws-02.wade0426.me/v1",
+    "google/gemma-3-27b-it",
     api_key="",                        # 請填入你的 API KEY
-    model="google/gemma-3-27b-it",            #
-    temperature=0
+    temperature=0,
+    timeout=600,                       # 沿用原本 openai SDK 預設的 600 秒
+    callbacks=[tracer.callback]
+)
+
+def normalize_city(city: str) -> str:
+    return city.strip().replace("臺", "台").removesuffix("市")
+
+def is_weather_error(result: str) -> bool:
+    return "系統錯誤" in result
+
+# 天氣結果快取：同城市 10 分鐘內共用結果，並行查詢只打一次後端，後端失敗時回傳最後一次成功的資料
+weather_cache = ToolResultCache(
+    ttl=600,
+    max_stale=3600,
+    key_fn=normalize_city,
+    is_error=is_weather_error
 )
 
 # 1. 定義工具 (模擬 50% 失敗率)
+# 熔斷器放在快取之下：只有真正打到後端的呼叫才記錄成敗，快取命中不會關閉或重置熔斷器
 @tool
+@weather_cache
+@weather_breaker.guard(rejected="系統錯誤：天氣服務暫停使用 (Circuit Open)，請稍後再試。", is_error=is_weather_error)
 def get_weather(city: str):
     """查詢指定城市的天氣。"""
     # 故意模擬出錯
@@ -39,59 +78,79 @@ llm_with_tools = llm.bind_tools(tools)
 # 2. 定義狀態與節點
 class AgentState(TypedDict):
     messages: Annotated[list[BaseMessage], add_messages]
+    retry_count: int    # 目前連續失敗次數 (成功即歸零)
+    summary: str        # 較舊對話的滾動摘要
 
 def chatbot_node(state: AgentState):
     """思考節點"""
-    response = llm_with_tools.invoke(state["messages"])
+    response = llm_with_tools.invoke(with_summary(state))
     return {"messages": [response]}
 
 tool_node_executor = ToolNode(tools)
 
+def tools_node(state: AgentState, config: RunnableConfig):
+    """執行工具，並把重試次數記在 state 中 (熔斷器成敗由 get_weather 的 guard 記錄)"""
+    retry_count = state.get("retry_count", 0)
+    if retry_count:
+        # 指數退避 + full jitter，避免多個對話同時重打後端
+        delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** (retry_count - 1)))
+        print(f"DEBUG: 第 {retry_count} 次重試，退避 {delay:.2f} 秒")
+        time.sleep(delay)
+
+    result = tool_node_executor.invoke(state, config)
+    failed = any(is_weather_error(msg.content) for msg in result["messages"])
+    return {"messages": result["messages"], "retry_count": retry_count + 1 if failed else 0}
+
 def fallback_node(state: AgentState):
-    """備援節點：當重試次數過多時執行"""
+    """備援節點：當重試次數過多或熔斷開啟時執行"""
     last_message = state["messages"][-1]
-    tool_call_id = last_message.tool_calls[0]["id"]
-    
-    error_message = ToolMessage(
-        content="系統提示：已達到最大重試次數 (Max Retries Reached)。請停止嘗試，並告知使用者服務暫時無法使用。",
-        tool_call_id=tool_call_id
-    )
-    return {"messages": [error_message]}
+    if state.get("retry_count", 0) >= MAX_RETRIES:
+        content = "系統提示：已達到最大重試次數 (Max Retries Reached)。請停止嘗試，並告知使用者服務暫時無法使用。"
+        reply = []
+    else:
+        content = "系統提示：天氣服務目前暫停使用 (Circuit Open)。"
+        # 熔斷期間直接回覆並結束這一輪，不再交回 agent，避免模型反覆呼叫工具直到 GraphRecursionError
+        reply = [AIMessage(content="抱歉，天氣服務目前暫停使用，請稍後再試。")]
+
+    # 每個 tool call 都要有對應的 ToolMessage
+    error_messages = [ToolMessage(content=content, tool_call_id=call["id"]) for call in last_message.tool_calls]
+    return {"messages": error_messages + reply, "retry_count": 0}
 
 # 3. 路由邏輯 (關鍵：判斷是否重試)
 def router(state: AgentState) -> Literal["tools", "fallback", "end"]:
-    messages = state["messages"]
-    last_message = messages[-1]
+    last_message = state["messages"][-1]
 
     if not last_message.tool_calls:
         return "end"
 
-    # 計算歷史紀錄中的連續錯誤次數
-    retry_count = 0
-    for msg in reversed(messages[:-1]):
-        if isinstance(msg, ToolMessage):
-            if "系統錯誤" in msg.content:
-                retry_count += 1
-            else:
-                break
-        elif isinstance(msg, HumanMessage):
-            break
-    
+    # 連續錯誤次數直接從 state 取得，不需回頭掃描整段對話
+    retry_count = state.get("retry_count", 0)
     print(f"DEBUG: 目前連續重試次數: {retry_count}")
     
-    if retry_count >= 3: # 設定上限為 3 次
+    if retry_count >= MAX_RETRIES:
+        return "fallback"
+    if weather_breaker.is_open():
         return "fallback"
+    if retry_count:
+        tracer.count("retries", node="tools")
     
     return "tools"
 
+def after_fallback(state: AgentState) -> Literal["agent", "end"]:
+    # 熔斷時 fallback 已直接回覆使用者
+    return "end" if isinstance(state["messages"][-1], AIMessage) else "agent"
+
 # 4. 建構 LangGraph 工作流
 workflow = StateGraph(AgentState)
 
-workflow.add_node("agent", chatbot_node)
-workflow.add_node("tools", tool_node_executor)
-workflow.add_node("fallback", fallback_node)
+workflow.add_node("compact", tracer.wrap("compact", make_compaction_node(llm, KEEP_TURNS, HISTORY_TOKEN_BUDGET)))
+workflow.add_node("agent", tracer.wrap("agent", chatbot_node))
+workflow.add_node("tools", tracer.wrap("tools", tools_node))
+workflow.add_node("fallback", tracer.wrap("fallback", fallback_node))
 
-workflow.set_entry_point("agent")
+# 每輪先壓縮歷史再交給 agent
+workflow.set_entry_point("compact")
+workflow.add_edge("compact", "agent")
 
 # 設定條件分支
 workflow.add_conditional_edges(
@@ -105,32 +164,39 @@ workflow.add_conditional_edges(
 )
 
 workflow.add_edge("tools", "agent")
-workflow.add_edge("fallback", "agent")
+workflow.add_conditional_edges("fallback", after_fallback, {"agent": "agent", "end": END})
 
-app = workflow.compile()
+# 以 checkpointer 保存同一個對話 session 的歷史
+app = workflow.compile(checkpointer=MemorySaver())
 
 # 5. 執行對話
 if __name__ == "__main__":
     print("--- 天氣機器人已啟動 (具備重試機制) ---")
+    session = {"configurable": {"thread_id": "cli"}}
     while True:
         user_input = input("\nUser: ")
         if user_input.lower() in ["exit", "q"]: break
 
         # 使用 stream 模式查看執行過程
-        for event in app.stream({"messages": [HumanMessage(content=user_input)]}):
-            for key, value in event.items():
-                if key == "agent":
-                    msg = value["messages"][-1]
-                    if msg.tool_calls:
-                        print(f" -> [Agent]: 決定呼叫工具 (判斷中...)")
-                    else:
-                        print(f" -> [Agent]: {msg.content}")
-                elif key == "tools":
-                    # 檢查工具執行結果是否包含錯誤字眼
-                    tool_res = value["messages"][-1].content
-                    if "系統錯誤" in tool_res:
-                        print(f" -> [Tools]: 🔴 系統故障，準備重試...")
-                    else:
-                        print(f" -> [Tools]: ✅ 成功取得資料")
-                elif key == "fallback":
-                    print(f" -> [Fallback]: ⚠️ 觸發熔斷，停止重試")
\ No newline at end of file
+        with tracer.run(user_input):
+            for event in app.stream({"messages": [HumanMessage(content=user_input)], "retry_count": 0}, session):
+                for key, value in event.items():
+                    if key == "agent":
+                        msg = value["messages"][-1]
+                        if msg.tool_calls:
+                            print(f" -> [Agent]: 決定呼叫工具 (判斷中...)")
+                        else:
+                            print(f" -> [Agent]: {msg.content}")
+                    elif key == "tools":
+                        # 檢查工具執行結果是否包含錯誤字眼
+                        tool_res = value["messages"][-1].content
+                        if "系統錯誤" in tool_res:
+                            print(f" -> [Tools]: 🔴 系統故障，準備重試...")
+                        else:
+                            print(f" -> [Tools]: ✅ 成功取得資料")
+                    elif key == "fallback":
+                        print(f" -> [Fallback]: ⚠️ 觸發熔斷，停止重試")
+                        msg = value["messages"][-1]
+                        if isinstance(msg, AIMessage):
+                            print(f" -> [Agent]: {msg.content}")
+        print(f"📊 [天氣快取] {weather_cache.stats} | 命中率 {weather_cache.hit_rate():.0%}")
\ No newline at end of file
@@ -1,14 +1,21 @@
+import re
+import os
+import csv
 import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from langchain_core.tools import tool
-from langchain_openai import ChatOpenAI
+from common.llm_client import chat_model
 from langchain_core.prompts import ChatPromptTemplate
 
 # 1. 初始化模型 (對應 ch4-1 實作)
-llm = ChatOpenAI(
-    base_url="https://ws-02.wade0426.me/v1",
+llm = chat_model(
+    "https://ws-02.wade0426.me/v1",
+    "google/gemma-3-27b-it",
     api_key="YOUR_API_KEY", # 記得填入你的 API Key
-    model="google/gemma-3-27b-it",
-    temperature=0
+    temperature=0,
+    timeout=600             # 沿用原本 openai SDK 預設的 600 秒
 )
 
 # 2. 定義 Tool (對應 Function Calling 原理中的「好的定義」)
@@ -47,17 +54,132 @@ prompt = ChatPromptTemplate.from_messages([
 # 組合 Chain: 提示詞 -> 模型 -> 參數提取
 chain = prompt | llm_with_tools | extract_tool_args
 
-# 6. 啟動對話迴圈
-print("--- 訂單機器人已啟動 (輸入 exit 或 q 退出) ---")
-while True:
-    user_input = input("User: ")
-    
-    if user_input.lower() in ["exit", "q"]:
-        print("Bye!")
-        break
+# 6. 規則式快速路徑：樣板化訂單直接用正規表示式擷取，不需呼叫 LLM
+FIELD_LABELS = {
+    "name": r"(?:姓名|名字|收件人|訂購人)",
+    "phone": r"(?:電話|手機|聯絡電話|連絡電話)",
+    "product": r"(?:商品|品名|產品|品項)",
+    "quantity": r"(?:數量|訂購數量)",
+    "address": r"(?:地址|收件地址|寄送地址|送貨地址)",
+}
+ANY_LABEL = "|".join(FIELD_LABELS.values())
+# 欄位值到分隔符號或下一個「標籤:」為止；標籤後必須有冒號，避免「名字叫…」「電話打不通」這類一般敘述被當成欄位
+FIELD_VALUE = r"\s*[:：]\s*(.+?)\s*(?=[,，;；\n]|(?:" + ANY_LABEL + r")\s*[:：]|$)"
+PHONE_RE = re.compile(r"(?<!\d)(09\d{2}[-\s]?\d{3}[-\s]?\d{3}|0\d{1,2}[-\s]?\d{3,4}[-\s]?\d{4})(?!\d)")
+ADDRESS_RE = re.compile(r"[\u4e00-\u9fff]{1,3}[縣市][\u4e00-\u9fff\d]{1,6}[區鄉鎮市][^,，;；\n]*?\d+號(?:\d+樓)?")
+QUANTITY_RE = re.compile(r"(\d+)\s*(?:個|份|盒|件|瓶|支|台|組|包|箱|杯)")
 
-    # 執行並獲取結果
-    result = chain.invoke({"user_input": user_input})
+def rule_extract(text: str):
+    """所有欄位都能可靠擷取時回傳 dict，否則回傳 None 交給 LLM"""
+    fields = {}
+    for field, label in FIELD_LABELS.items():
+        m = re.search(label + FIELD_VALUE, text)
+        if m:
+            fields[field] = m.group(1).strip()
 
-    # 輸出結果 (確保中文正常顯示)
-    print(json.dumps(result, ensure_ascii=False, indent=2))
\ No newline at end of file
+    # 沒有標籤時，用格式本身辨識電話與地址
+    if "phone" not in fields and (m := PHONE_RE.search(text)):
+        fields["phone"] = m.group(1)
+    if "address" not in fields and (m := ADDRESS_RE.search(text)):
+        fields["address"] = m.group(0)
+    # 標籤後的值也必須完全符合格式，否則視為不可靠，交給 LLM
+    if "phone" in fields:
+        m = PHONE_RE.fullmatch(fields["phone"])
+        if not m:
+            return None
+        fields["phone"] = re.sub(r"[-\s]", "", m.group(1))
+    if "address" in fields and not ADDRESS_RE.fullmatch(fields["address"]):
+        return None
+    if "quantity" in fields:
+        m = re.search(r"\d+", fields["quantity"])
+        fields["quantity"] = int(m.group(0)) if m else None
+    elif (m := QUANTITY_RE.search(text)):
+        fields["quantity"] = int(m.group(1))
+
+    if all(fields.get(f) for f in FIELD_LABELS):
+        return {f: fields[f] for f in FIELD_LABELS}
+    return None
+
+def extract_order(text: str):
+    """先走規則式快速路徑，失敗才呼叫 LLM；回傳 (結果, 來源)"""
+    result = rule_extract(text)
+    if result is not None:
+        return result, "rule"
+    return chain.invoke({"user_input": text}), "llm"
+
+# 7. 批次模式：串流讀取訂單檔，限制同時在途的請求數，完成一筆寫一筆
+def iter_orders(path: str):
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, "r", encoding="utf-8-sig") as f:
+        if ext == ".jsonl":
+            for i, line in enumerate(f, 1):
+                if line.strip():
+                    item = json.loads(line)
+                    yield str(item.get("id", i)), item.get("message") or item.get("text", "")
+        else:
+            reader = csv.DictReader(f)
+            col = next((c for c in ["message", "text", "content", "order"] if c in (reader.fieldnames or [])), None)
+            for i, row in enumerate(reader, 1):
+                yield str(row.get("id") or i), row[col] if col else next(iter(row.values()))
+
+def run_bulk(input_path: str, output_path: str, concurrency: int):
+    counts = {"rule": 0, "llm": 0, "error": 0}
+    t0 = time.perf_counter()
+
+    def work(order_id, text):
+        try:
+            result, source = extract_order(text)
+            return {"id": order_id, "source": source, "result": result}
+        except Exception as e:
+            return {"id": order_id, "source": "error", "error": repr(e)}
+
+    with open(output_path, "w", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        in_flight = set()
+
+        def drain(futures):
+            for fut in futures:
+                record = fut.result()
+                counts[record["source"]] += 1
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+
+        for order_id, text in iter_orders(input_path):
+            # 在途請求達上限時，先等至少一筆完成再讀下一筆 (背壓)
+            if len(in_flight) >= concurrency:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                drain(done)
+            in_flight.add(pool.submit(work, order_id, text))
+        drain(wait(in_flight)[0])
+
+    total = sum(counts.values())
+    elapsed = time.perf_counter() - t0
+    print(f"✅ 完成 {total} 筆 ({total / elapsed:.1f} 筆/秒)：規則 {counts['rule']}、LLM {counts['llm']}、失敗 {counts['error']}")
+    print(f"結果已儲存至: {output_path}")
+
+# 8. 啟動對話迴圈
+def interactive():
+    print("--- 訂單機器人已啟動 (輸入 exit 或 q 退出) ---")
+    while True:
+        user_input = input("User: ")
+        
+        if user_input.lower() in ["exit", "q"]:
+            print("Bye!")
+            break
+
+        # 執行並獲取結果
+        result, source = extract_order(user_input)
+
+        # 輸出結果 (確保中文正常顯示)
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="訂單資料擷取")
+    parser.add_argument("--bulk", help="批次模式：訂單檔 (.csv 含 message 欄位，或 .jsonl)")
+    parser.add_argument("--output", default="orders_extracted.jsonl", help="批次結果輸出 (JSONL)")
+    parser.add_argument("--concurrency", type=int, default=8, help="同時在途的 LLM 請求上限")
+    args = parser.parse_args()
+
+    if args.bulk:
+        run_bulk(args.bulk, args.output, args.concurrency)
+    else:
+        interactive()